@@ -0,0 +1,316 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Benchmarks for grammar, printed as JSON to compare between commits"""
+
+import argparse
+import gc
+import json
+import platform
+import random
+import sys
+from timeit import default_timer as timer
+
+import grammar
+from grammar import Corrections
+from grammar import Transformers
+from grammar import Wording
+from grammar.Parallel import ParallelChecker
+from grammar.Transformers import compile_transform
+from grammar.Transformers import partitionize
+from grammar.Units import SequenceManager
+
+OPTIONS = {
+    'do_decode_html': True,
+    'do_ellipsis': True,
+    'do_quotations': True,
+    'do_askfm': False,
+    'do_fixcaps': True,
+    'do_fixi': True,
+    'do_fixnewline': True,
+}
+
+WORDS = (
+    'the a an and but so of to in on at with for from my our this that it is '
+    'was be have had do did not just really so very good bad day night time '
+    'people love hate want need know think see go going went get got make '
+    'lol omg today tomorrow school work home game music friends life'
+).split()
+
+# Texts with at least one detection
+POSITIVES = (
+    "Your the best",
+    "Its here or there",
+    "of you're own!",
+    "To each there own",
+    "Whose been there?",
+    "They're is a cow",
+    "Their must be something!",
+    "I am hear",
+    "this is better then that",
+    "I did this and than I did that",
+    "I should of went there",
+    "your are",
+    "you don't supposed to",
+    "people whom are",
+)
+
+# Kinds of texts in the corpus, with their weights
+MIX = (
+    ('negative', 70),
+    ('positive', 10),
+    ('long', 5),
+    ('allcaps', 10),
+    ('quotes', 5),
+)
+
+
+def generate_text(rng, kind):
+    """Return a synthetic tweet of some kind"""
+    words = [rng.choice(WORDS)
+             for _ in range(rng.randrange(40, 120) if kind == 'long' else rng.randrange(4, 20))]
+    if kind != 'negative':
+        # the other kinds contain errors
+        words.insert(rng.randrange(len(words) + 1), rng.choice(POSITIVES))
+    if kind == 'quotes':
+        for _ in range(rng.randrange(1, 4)):
+            i = rng.randrange(len(words))
+            words[i:i + 3] = ['&quot;' + ' '.join(words[i:i + 3]) + '&quot;']
+    text = ' '.join(words)
+    text = text[0].upper() + text[1:] + rng.choice(('.', '!', '?', '...', ''))
+    if kind == 'allcaps':
+        text = text.upper()
+    return text
+
+
+def generate_corpus(size, seed=0, mix=MIX):
+    """Return a deterministic list of synthetic tweets"""
+    rng = random.Random(seed)
+    kinds = [kind for kind, weight in mix for _ in range(weight)]
+    return [generate_text(rng, rng.choice(kinds)) for _ in range(size)]
+
+
+def timed(results, name, items, function):
+    """Time function over some items, add the result and return its outputs"""
+    start = timer()
+    outputs = [function(item) for item in items]
+    seconds = timer() - start
+    results[name] = {
+        'items': len(items),
+        'seconds': seconds,
+        'us_per_item': seconds * 1e6 / len(items) if items else 0.0,
+    }
+    return outputs
+
+
+def bench_stages(corpus):
+    """Time each stage of the pipeline separately"""
+    results = {}
+    parser = grammar.CorrectionManager()
+    timed(results, 'load_text', corpus, lambda text: (
+        parser.reset(), parser.load_text(text, **OPTIONS)))
+    transform_ = compile_transform(**OPTIONS)
+    texts = timed(results, 'transform', corpus, transform_)
+    units = timed(results, 'partitionize', texts, partitionize)
+    sequences = timed(results, 'SequenceManager', units, SequenceManager)
+
+    def check(sequence):
+        parser.reset()
+        parser.sequence = sequence
+        parser.do_checks_all()
+        return sequence, parser.corrected
+    checked = timed(results, 'do_checks_all', sequences, check)
+    checked = [(sequence, corrected)
+               for sequence, corrected in checked if corrected]
+
+    def generate_texts(item):
+        parser.reset()
+        parser.sequence, parser.corrected = item
+        parser.generate_texts()
+        return parser.corrections, parser.corrected
+    generated = timed(results, 'generate_texts', checked, generate_texts)
+    random.seed(0)
+    timed(results, 'Wording.generate', generated, lambda item: Wording.generate(
+        item[0], item[1].keys(), 'user'))
+    return results
+
+
+def bench_rules(corpus):
+    """Time each rule on the words that trigger it"""
+    results = {}
+    parser = grammar.CorrectionManager()
+    texts = list(map(compile_transform(**OPTIONS), corpus))
+    for rule in Corrections.RULES:
+        name = rule.__name__.rsplit('.', 1)[-1]
+        # the rules change the sequences, so each one gets fresh ones
+        sequences = [SequenceManager(partitionize(text)) for text in texts]
+        calls = 0
+        matches = 0
+        seconds = 0.0
+        for sequence in sequences:
+            parser.reset()
+            parser.sequence = sequence
+            for cur in sequence.iter_words():
+                if cur.word_lower in rule.KEYWORDS:
+                    calls += 1
+                    start = timer()
+                    rule.do(parser, cur)
+                    seconds += timer() - start
+            matches += bool(parser.corrected)
+        results[name] = {
+            'calls': calls,
+            'matches': matches,
+            'seconds': seconds,
+            'us_per_call': seconds * 1e6 / calls if calls else 0.0,
+        }
+    return results
+
+
+def bench_parallel(corpus, processes=(1, 2, 4, 8), chunksize=256):
+    """Measure the throughput of the parallel checker for each pool size"""
+    results = []
+    for n in processes:
+        with ParallelChecker(n, chunksize, **OPTIONS) as checker:
+            # warm up the workers
+            for result in checker.check(corpus[:n * chunksize]):
+                pass
+            start = timer()
+            for result in checker.check(corpus):
+                pass
+            rate = len(corpus) / (timer() - start)
+        results.append({
+            'processes': n,
+            'texts_per_second': rate,
+            'speedup': rate / results[0]['texts_per_second'] if results else 1.0,
+        })
+    return results
+
+
+def count_units(counts):
+    """Return Word and Space classes that count their instances"""
+    class CountingWord(Transformers.Word):
+        __slots__ = ()
+
+        def __new__(cls, *args):
+            counts[0] += 1
+            return super(CountingWord, cls).__new__(cls)
+
+    class CountingSpace(Transformers.Space):
+        __slots__ = ()
+
+        def __new__(cls, *args):
+            counts[0] += 1
+            return super(CountingSpace, cls).__new__(cls)
+    return CountingWord, CountingSpace
+
+
+def bench_allocations(corpus):
+    """Measure the units, the GC collections and the memory of each manager mode
+
+    Both managers first check the whole corpus once, so the one-off
+    allocations (caches, the pool) are not measured in whichever runs first.
+    The peak is traced for each text, above the memory already in use: the
+    peak of the whole run depends on when the interpreter resizes its tables,
+    such as the interned strings, which only shows in the max.
+    Return None, with a message, where tracemalloc is missing (Python 2).
+    """
+    try:
+        import tracemalloc
+    except ImportError:
+        tracemalloc = None
+    if tracemalloc is None or not hasattr(gc, 'get_stats'):
+        sys.stderr.write('allocations: skipped, tracemalloc and gc.get_stats need Python 3.4+\n')
+        return None
+    results = {}
+    classes = Transformers.Word, Transformers.Space
+    modes = (('default', False), ('pooled', True))
+    # Python 3.9+ resets the peak without forgetting the traces
+    reset_peak = getattr(tracemalloc, 'reset_peak', tracemalloc.clear_traces)
+    parsers = {}
+    for name, pooled in modes:
+        parser = parsers[name] = grammar.CorrectionManager(pooled=pooled)
+        for text in corpus:
+            parser.reset()
+            parser.load_text(text, **OPTIONS)
+    for name, pooled in modes:
+        parser = parsers[name]
+        counts = [0]
+        peaks = []
+        Transformers.Word, Transformers.Space = count_units(counts)
+        collections = [stats['collections'] for stats in gc.get_stats()]
+        tracemalloc.start()
+        try:
+            start = timer()
+            for text in corpus:
+                reset_peak()
+                before = tracemalloc.get_traced_memory()[0]
+                parser.reset()
+                parser.load_text(text, **OPTIONS)
+                peaks.append(tracemalloc.get_traced_memory()[1] - before)
+            seconds = timer() - start
+        finally:
+            tracemalloc.stop()
+            Transformers.Word, Transformers.Space = classes
+        peaks.sort()
+        results[name] = {
+            'units_per_text': counts[0] / float(len(corpus)),
+            'gc_collections': [stats['collections'] - before
+                               for stats, before in zip(gc.get_stats(), collections)],
+            'peak_kib_per_text': {
+                'median': peaks[len(peaks) // 2] / 1024.0,
+                'p99': peaks[len(peaks) * 99 // 100] / 1024.0,
+                'max': peaks[-1] / 1024.0,
+            },
+            'us_per_text': seconds * 1e6 / len(corpus),  # traced, so slower
+        }
+    return results
+
+
+BENCHMARKS = ('stages', 'rules', 'parallel', 'allocations')
+
+
+def int_list(value):
+    """Parse a comma-separated list of integers"""
+    return [int(n) for n in value.split(',')]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmarks for grammar')
+    parser.add_argument('benchmarks', nargs='*', metavar='BENCHMARK',
+                        help='%s (default: stages rules)' % ', '.join(BENCHMARKS))
+    parser.add_argument('--size', type=int, default=100000,
+                        help='number of texts in the corpus')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--processes', type=int_list,
+                        default=[1, 2, 4, 8],
+                        help='comma-separated pool sizes of the parallel benchmark (default: 1,2,4,8)')
+    parser.add_argument('--output', help='file for the JSON results')
+    arguments = parser.parse_args(argv)
+    for benchmark in arguments.benchmarks:
+        if benchmark not in BENCHMARKS:
+            parser.error('unknown benchmark: %s' % benchmark)
+    benchmarks = arguments.benchmarks or ['stages', 'rules']
+    corpus = generate_corpus(arguments.size, arguments.seed)
+    results = {
+        'python': platform.python_version(),
+        'size': arguments.size,
+        'seed': arguments.seed,
+    }
+    if 'stages' in benchmarks:
+        results['stages'] = bench_stages(corpus)
+    if 'rules' in benchmarks:
+        results['rules'] = bench_rules(corpus)
+    if 'allocations' in benchmarks:
+        allocations = bench_allocations(corpus)
+        if allocations is not None:
+            results['allocations'] = allocations
+    if 'parallel' in benchmarks:
+        results['parallel'] = bench_parallel(corpus, arguments.processes)
+    output = open(arguments.output, 'w') if arguments.output else sys.stdout
+    json.dump(results, output, indent=2, sort_keys=True)
+    output.write('\n')
+    if arguments.output:
+        output.close()
+
+if __name__ == '__main__':
+    main()
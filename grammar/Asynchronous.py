@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+
+"""Asynchronous checker for asyncio services: grammar.AsyncCorrector"""
+
+import asyncio
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import threading
+
+from .Corrector import CorrectionManager
+
+# Manager of each thread (or process) of the executors
+local = threading.local()
+
+
+def check_texts(texts, options):
+    """Check some texts with the manager of the current thread"""
+    parser = getattr(local, 'parser', None)
+    if parser is None:
+        parser = local.parser = CorrectionManager()
+    return parser.check_batch(texts, **options)
+
+
+async def iterate(texts):
+    """Iterate asynchronously over an iterable"""
+    for text in texts:
+        yield text
+
+
+class AsyncCorrector(object):
+
+    """This checker runs the checks in an executor, off the event loop.
+
+    At most queue_depth texts are waiting or being checked: check waits for
+    room before submitting its text, so bursts slow the producers down
+    instead of piling up. The texts shorter than small_text that are checked
+    in the same iteration of the loop are submitted together, up to
+    batch_size at a time. The default executor is a thread; a
+    ProcessPoolExecutor keeps the checks from competing with the loop for
+    the GIL.
+    """
+
+    def __init__(self, executor=None, queue_depth=256, timeout=None,
+                 batch_size=64, small_text=280, **options):
+        self.own_executor = executor is None
+        self.executor = ThreadPoolExecutor(1) if executor is None else executor
+        self.queue_depth = queue_depth
+        self.timeout = timeout
+        self.batch_size = batch_size
+        self.small_text = small_text
+        self.options = options
+        self.semaphore = None  # created in the loop
+        self.batch = []  # (text, future) waiting to be submitted
+
+    async def check(self, text, timeout=None):
+        """Return the CorrectionResult of a text
+
+        Raises asyncio.TimeoutError after timeout seconds (default: the
+        timeout of the checker). The text is still checked, but its result
+        is dropped.
+        """
+        loop = asyncio.get_event_loop()
+        if self.semaphore is None:
+            self.semaphore = asyncio.Semaphore(self.queue_depth)
+        await self.semaphore.acquire()
+        future = loop.create_future()
+        if len(text) >= self.small_text:
+            self.submit(loop, [(text, future)])
+        else:
+            self.batch.append((text, future))
+            if len(self.batch) >= self.batch_size:
+                self.flush(loop)
+            elif len(self.batch) == 1:
+                # after the other checks of this iteration
+                loop.call_soon(self.flush, loop)
+        return await asyncio.wait_for(
+            future, self.timeout if timeout is None else timeout)
+
+    def flush(self, loop):
+        """Submit the texts waiting to be batched"""
+        if self.batch:
+            batch, self.batch = self.batch, []
+            self.submit(loop, batch)
+
+    def submit(self, loop, batch):
+        """Check a batch of (text, future) in the executor"""
+        done = loop.run_in_executor(
+            self.executor, check_texts, [text for text, future in batch], self.options)
+        done.add_done_callback(lambda done: self.resolve(batch, done))
+
+    def resolve(self, batch, done):
+        """Set the futures of a batch once it has been checked"""
+        for i, (text, future) in enumerate(batch):
+            self.semaphore.release()
+            if future.done():
+                # timed out
+                continue
+            if done.cancelled():
+                future.cancel()
+            elif done.exception() is not None:
+                future.set_exception(done.exception())
+            else:
+                future.set_result(done.result()[i])
+
+    async def check_stream(self, texts):
+        """Yield the CorrectionResult of each text, in input order
+
+        The texts can be an iterable or an asynchronous iterable. Up to
+        queue_depth of them are read ahead.
+        """
+        if not hasattr(texts, '__aiter__'):
+            texts = iterate(texts)
+        pending = deque()
+        try:
+            async for text in texts:
+                pending.append(asyncio.ensure_future(self.check(text)))
+                if len(pending) >= self.queue_depth:
+                    yield await pending.popleft()
+            while pending:
+                yield await pending.popleft()
+        finally:
+            for task in pending:
+                task.cancel()
+
+    def close(self):
+        """Wait for the checks, and stop the executor if it was created here"""
+        if self.own_executor:
+            self.executor.shutdown()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        # waiting for the checks in the loop would stop the other coroutines
+        await asyncio.get_event_loop().run_in_executor(None, self.close)
@@ -0,0 +1,207 @@
+#!/usr/bin/env python
+
+"""Caches of results for CorrectionManager, for texts that keep coming back"""
+
+from collections import OrderedDict
+import hashlib
+import json
+import os
+import sqlite3
+import time
+
+from .Corrector import CorrectionResult
+from .Units import LEXICON
+
+# Hash of the sources of the package, see ruleset_version
+RULESET_VERSION = None
+
+
+class LRUCache(object):
+
+    """This cache keeps the most recently used results, up to a size.
+
+    With a ttl (in seconds), results older than it are checked again. Any
+    cache for CorrectionManager has the same get and set methods.
+    """
+
+    def __init__(self, size=10000, ttl=None, clock=time.time):
+        self.size = size
+        self.ttl = ttl
+        self.clock = clock
+        self.entries = OrderedDict()  # key -> (expiry time, result)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key):
+        """Return the result for a key, or None"""
+        try:
+            expiry, result = self.entries.pop(key)
+        except KeyError:
+            self.misses += 1
+            return None
+        if expiry is not None and self.clock() >= expiry:
+            self.expirations += 1
+            self.misses += 1
+            return None
+        # most recently used
+        self.entries[key] = expiry, result
+        self.hits += 1
+        return result
+
+    def set(self, key, result):
+        """Store the result for a key, forgetting the least recently used ones"""
+        self.entries.pop(key, None)
+        expiry = None if self.ttl is None else self.clock() + self.ttl
+        self.entries[key] = expiry, result
+        while len(self.entries) > self.size:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        """Forget every result"""
+        self.entries.clear()
+
+    def get_stats(self):
+        """Return the statistics of the cache as a dict"""
+        lookups = self.hits + self.misses
+        return {
+            'size': len(self.entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': float(self.hits) / lookups if lookups else 0.0,
+            'evictions': self.evictions,
+            'expirations': self.expirations,
+        }
+
+    def __len__(self):
+        return len(self.entries)
+
+
+def ruleset_version():
+    """Return a hash of the sources of the package and of the lexicon, which changes with any rule"""
+    global RULESET_VERSION
+    if RULESET_VERSION is None:
+        digest = hashlib.sha1()
+        package = os.path.dirname(os.path.abspath(__file__))
+        for directory, directories, files in sorted(os.walk(package)):
+            directories.sort()
+            for name in sorted(files):
+                if name.endswith('.py'):
+                    path = os.path.join(directory, name)
+                    digest.update(os.path.relpath(path, package).replace(os.sep, '/').encode('utf-8'))
+                    with open(path, 'rb') as f:
+                        digest.update(f.read())
+        RULESET_VERSION = digest.hexdigest()[:16]
+    return RULESET_VERSION + LEXICON.get_digest()[:16]
+
+
+class DiskCache(object):
+
+    """This cache keeps the results in an SQLite database, for any process.
+
+    The database is in WAL mode, so lookups from many processes do not block
+    each other. The keys are hashed with the version of the rules (default:
+    ruleset_version, which follows the lexicon files loaded), and the results
+    of other versions are deleted when the cache is opened. Only the kinds and
+    the corrections are kept, not the details.
+
+    The new results are written together, in a transaction for every
+    batch_size of them, and by flush and close: until then, the other
+    processes do not see them.
+    """
+
+    def __init__(self, path, ttl=None, clock=time.time, version=None, batch_size=256):
+        self.path = path
+        self.ttl = ttl
+        self.clock = clock
+        self.fixed_version = version
+        self.batch_size = batch_size
+        self.pending = {}  # key in the database -> row to write
+        self.hits = 0
+        self.misses = 0
+        self.connection = sqlite3.connect(path, timeout=30)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        with self.connection:
+            self.connection.execute(
+                'CREATE TABLE IF NOT EXISTS results ('
+                'key TEXT PRIMARY KEY, version TEXT, created REAL, value TEXT)')
+            self.connection.execute(
+                'DELETE FROM results WHERE version != ?', (self.get_version(),))
+
+    def get_version(self):
+        """Return the current version of the rules"""
+        return self.fixed_version or ruleset_version()
+
+    def hash_key(self, key):
+        """Return the key in the database for a key of the manager"""
+        text, detect_only = key[:2]
+        digest = hashlib.sha1(self.get_version().encode('utf-8'))
+        digest.update(b'1' if detect_only else b'0')
+        # byte strings (Python 2) are taken as UTF-8 text
+        digest.update(text if isinstance(text, bytes) else text.encode('utf-8'))
+        return digest.hexdigest()
+
+    def get(self, key):
+        """Return the result for a key, or None"""
+        hashed = self.hash_key(key)
+        row = self.pending.get(hashed)
+        if row is not None:
+            row = row[2:]
+        else:
+            row = self.connection.execute(
+                'SELECT created, value FROM results WHERE key = ?', (hashed,)).fetchone()
+        if row is None or (self.ttl is not None and self.clock() >= row[0] + self.ttl):
+            self.misses += 1
+            return None
+        self.hits += 1
+        value = json.loads(row[1])
+        result = CorrectionResult(key[0], value['corrected'])
+        result._corrections = value['corrections']
+        return result
+
+    def set(self, key, result):
+        """Store the result for a key"""
+        value = json.dumps({
+            'corrected': dict(result.corrected),
+            'corrections': result.corrections,
+        })
+        hashed = self.hash_key(key)
+        self.pending[hashed] = hashed, self.get_version(), self.clock(), value
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """Write the new results to the database"""
+        if self.pending:
+            with self.connection:
+                self.connection.executemany(
+                    'INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?)',
+                    list(self.pending.values()))
+            self.pending.clear()
+
+    def clear(self):
+        """Forget every result"""
+        self.pending.clear()
+        with self.connection:
+            self.connection.execute('DELETE FROM results')
+
+    def close(self):
+        self.flush()
+        self.connection.close()
+
+    def get_stats(self):
+        """Return the statistics of the cache as a dict"""
+        lookups = self.hits + self.misses
+        return {
+            'size': len(self),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': float(self.hits) / lookups if lookups else 0.0,
+        }
+
+    def __len__(self):
+        self.flush()
+        return self.connection.execute('SELECT COUNT(*) FROM results').fetchone()[0]
@@ -1,5 +1,26 @@
 #!/usr/bin/env python
 
+"""Correction rules
+
+Each rule declares the KEYWORDS that trigger it, the PASSES in which it runs
+(1 = initial run, 10+ = rerun groups) and the RERUNS groups it may request.
+Rules in rerun groups also declare their LOOKAHEAD, the number of following
+words they read, so that only the words that can see a change are rerun.
+
+The do function of most rules is compiled from patterns of words (see
+grammar.Patterns). The patterns cannot delete words or spaces (theyre_be,
+of), map words to others (of), search a window for a sequence of words (of)
+or only require the words before the keyword to be in its sentence
+(whom_be), so these rules are written by hand.
+
+All the rules are checked in a single scan of the words: each word only
+calls the rules of its keyword, from DISPATCH, and each compiled rule only
+the patterns of that keyword. At most two rules share a keyword, so
+there is no matcher merging the rules.
+"""
+
+from itertools import combinations
+
 from . import possessive_as_be
 from . import youre_noun
 from . import its_own
@@ -15,3 +36,49 @@ from . import of
 from . import your_are
 from . import supposed_to
 from . import whom_be
+
+# Registered rules, in the order in which they are checked
+RULES = (
+    possessive_as_be,
+    youre_noun,
+    its_own,
+    there_own,
+    whose_been,
+    theyre_be,
+    their_modal,
+    be_noun,
+    then,
+    than,
+    of,
+    your_are,
+    supposed_to,
+    whom_be,
+)
+
+# Every word that triggers at least one rule
+KEYWORDS = set().union(*(rule.KEYWORDS for rule in RULES))
+
+
+def build_dispatch(passes):
+    """Map each keyword to the tuple of rules it triggers in any of the passes"""
+    dispatch = {}
+    for rule in RULES:
+        if rule.PASSES & passes:
+            for keyword in rule.KEYWORDS:
+                dispatch[keyword] = dispatch.get(keyword, ()) + (rule.do,)
+    return dispatch
+
+
+# Rerun groups that may be requested after the initial run
+RERUN_GROUPS = set().union(*(rule.RERUNS for rule in RULES))
+
+# Number of words before a change that a rerun group has to recheck
+RERUN_REACH = dict((group, max(rule.LOOKAHEAD for rule in RULES
+                               if group in rule.PASSES))
+                   for group in RERUN_GROUPS)
+
+# Dispatch tables for the initial run and for every combination of reruns
+DISPATCH = {frozenset([1]): build_dispatch(set([1]))}
+for n in range(1, len(RERUN_GROUPS) + 1):
+    for groups in combinations(sorted(RERUN_GROUPS), n):
+        DISPATCH[frozenset(groups)] = build_dispatch(set(groups))
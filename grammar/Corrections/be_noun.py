@@ -1,34 +1,21 @@
 #!/usr/bin/env python
 
+from ..Patterns import Pattern
+from ..Patterns import compile_rule
+from ..Units import LEXICON
+KEYWORDS = set(['hear', 'board'])
+PASSES = set([1])
+RERUNS = set()
 # no 'am'
 SET_BE = set(['be', 'is', 'are', "isn't", "aren't"])
+LEXICON.add('be_noun.be', SET_BE)
 
-
-def do(self, cur):
-    """Keyword: hear/board
-    Src: ((?<=I )am|are|be) _hear_
-    Dst: ... here
-    Src: ((?<=I )am|are|be) _board_ with
-    Dst: ... bored with
-
-    Removed: they {are board of} directors
-    """
-    if cur.word_lower != 'hear':
-        if cur.word_lower == 'board':
-            if not self.sequence.next_has_continuous(1):
-                return
-            if self.sequence.next_word(1).word_lower != 'with':
-                return
-        # else: return
-    if not self.sequence.prev_has_continuous(2):
-        return
-    if self.sequence.prev_word(1).word_lower == 'am':
-        if self.sequence.prev_word(2).word_lower == 'i':
-            self.sequence.prev_word(2).mark_common()
-        else:
-            return
-    elif self.sequence.prev_word(1).word_lower not in SET_BE:
-        return
-    self.matched(cur.word_lower)  # in ['hear', 'board']
-    self.sequence.prev_word(1).mark_common()
-    cur.replace('here' if cur.word_lower == 'hear' else 'bored')
+# Keyword: hear/board
+# Removed: they {are board of} directors
+do = compile_rule(
+    __name__,
+    Pattern("i am [hear]", "~ ~ here", 'hear'),
+    Pattern("<word> <be_noun.be> [hear]", "= ~ here", 'hear'),
+    Pattern("i am [board] with", "~ ~ bored =", 'board'),
+    Pattern("<word> <be_noun.be> [board] with", "= ~ bored =", 'board'),
+)
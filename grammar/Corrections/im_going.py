@@ -1,5 +1,9 @@
 #!/usr/bin/env python
 
+KEYWORDS = set(['going'])
+PASSES = set([1])
+RERUNS = set()
+
 
 def do(self, cur):  # pragma: no cover
     """Keyword: going
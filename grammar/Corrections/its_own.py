@@ -1,16 +1,14 @@
 #!/usr/bin/env python
 
+from ..Patterns import Pattern
+from ..Patterns import compile_rule
+KEYWORDS = set(['own'])
+PASSES = set([1])
+RERUNS = set([10])
 
-def do(self, cur):
-    """Keyword: own
-    Src: it's _
-    Dst: [its] _
-    """
-    if not self.sequence.prev_has_continuous(1):
-        return
-    if self.sequence.prev_word(1).word_lower != "it's":
-        return
-    self.matched('its_po')
-    self.sequence.prev_word(1).replace_autocap("its")
-    self.rerun.add(10)  # Rerun: possesive_as_be for its
-    cur.mark_common()
+# Keyword: own
+# Rerun: possesive_as_be for its
+do = compile_rule(
+    __name__,
+    Pattern("it's _", "^its ~", 'its_po', reruns={10: -1}),
+)
@@ -1,8 +1,14 @@
 #!/usr/bin/env python
 
+from ..Units import LEXICON
+KEYWORDS = set(['of'])
+PASSES = set([1])
+RERUNS = set()
 SET_MODAL = set(['could', 'should', 'would', 'must',
                  "couldn't", "shouldn't", "wouldn't", "mustn't"])
 SET_CMP = set(['more', 'less'])
+MODAL = LEXICON.add('of.modal', SET_MODAL)
+CMP = LEXICON.add('of.cmp', SET_CMP)
 
 
 def do(self, cur):
@@ -43,7 +49,7 @@ def do(self, cur):
         # Exception 3b: {might of} <determiner|NP>
         if next_word_1 and (next_word_1.is_determiner() or next_word_1.is_pronoun_personal()):
             return
-    elif prev_words[not_shift].word_lower not in SET_MODAL:
+    elif not prev_words[not_shift].classes & MODAL:
         return
     # Exception 4: (more|less) (of) <NP>+ than <NP>+ {<modal> of} <NP>+
     # [more of <word>+ than <word>+ (prev) not?] of
@@ -59,7 +65,7 @@ def do(self, cur):
             elif finding == 2:
                 if prev_words[i].word_lower == 'of':
                     # if i >= 1 and  # (updated range instead)
-                    if prev_words[i + 1].word_lower in SET_CMP:
+                    if prev_words[i + 1].classes & CMP:
                         return
     self.matched('of')
     # for i in range(not_shift + 1):
@@ -137,3 +143,5 @@ FIX_past_to_participle = {
     'wore': 'worn',  # wear
     'withdrew': 'withdrawn',  # withdraw
 }
+# changed in place when a lexicon file is loaded
+FIX_past_to_participle = LEXICON.add_map('of.past_to_participle', FIX_past_to_participle)
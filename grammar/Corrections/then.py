@@ -1,28 +1,23 @@
 #!/usr/bin/env python
 
+from ..Patterns import Pattern
+from ..Patterns import compile_rule
+from ..Units import LEXICON
+KEYWORDS = set(['then'])
+PASSES = set([1])
+RERUNS = set()
 SET_COMPARATIVE = set(['better', 'worse', 'more', 'less'])
 SET_NOFOLLOW = set(['lol', 'be', 'do', 'did', 'get', 'got'])
+LEXICON.add('then.comparative', SET_COMPARATIVE)
+LEXICON.add('then.nofollow', SET_NOFOLLOW)
 
-
-def do(self, cur):
-    """Keyword: then
-    Src: <word> (better|more|less) _ <word>
-    Dst: ... [than] <word>
-    """
-    prev_words = self.sequence.prev_get_words_continuous()
-    if len(prev_words) < 2:
-        return
-    if prev_words[0].word_lower not in SET_COMPARATIVE:
-        return
-    if not self.sequence.next_has_continuous(1):
-        return
-    # Exception 1: then <verb:(be|do|did|get|got)|lol> <noun>
-    if self.sequence.next_word(1).word_lower in SET_NOFOLLOW:
-        return
-    # Exception 2: if/when ... {better(,) then}
-    for p in prev_words:
-        if p.word_lower == 'if' or p.word_lower == 'when':
-            return
-    self.matched('then')
-    prev_words[0].mark_common()
-    cur.replace('than')
+# Keyword: then
+do = compile_rule(
+    __name__,
+    Pattern("<word> <then.comparative> _ <word>", "= ~ than =", 'then', first_word=True, unless=(
+        # Exception 1: then <verb:(be|do|did|get|got)|lol> <noun>
+        "_ <then.nofollow>",
+        # Exception 2: if/when ... {better(,) then}
+        "if|when ... <then.comparative> _",
+    )),
+)
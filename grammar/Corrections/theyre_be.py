@@ -2,10 +2,17 @@
 
 from .be_noun import SET_BE
 from .of import SET_MODAL as SET_OF_MODAL
+from ..Units import LEXICON
+KEYWORDS = set(["they're"])
+PASSES = set([1])
+RERUNS = set()
 SET_THERETHEIR = set(['there', 'their'])
 SET_MODAL_SINGULAR = set(['is', "isn't"])
 # 'is' is already checked
 SET_MODAL = SET_BE | SET_OF_MODAL
+THERETHEIR = LEXICON.add('theyre_be.theretheir', SET_THERETHEIR)
+MODAL_SINGULAR = LEXICON.add('theyre_be.modal_singular', SET_MODAL_SINGULAR)
+MODAL = LEXICON.derive('theyre_be.modal', ['be_noun.be', 'of.modal'])
 
 
 def do(self, cur):
@@ -24,7 +31,7 @@ def do(self, cur):
     # Exception 1: the difference between their/there, <, and {they're is}
     if (self.sequence.prev_has_continuous(1) and self.sequence.prev_has(2) and
         self.sequence.prev_word(1).word_lower == 'and' and
-            self.sequence.prev_word(2).word_lower in SET_THERETHEIR):
+            self.sequence.prev_word(2).classes & THERETHEIR):
             return
     # Exception 2b: {'they're' is} 'they are'
     # Exception 2: {they're, aren't} they?"
@@ -34,12 +41,12 @@ def do(self, cur):
     elif not self.sequence.next_has_continuous(1):
         return
     next_word = self.sequence.next_word(1)
-    if next_word.word_lower in SET_MODAL_SINGULAR:
+    if next_word.classes & MODAL_SINGULAR:
         self.matched('theyre_be')
         cur.replace_autocap("there's")
         self.sequence.next_space(1).replace('')  # collapse space
         next_word.replace('')  # delete next word (is)
-    elif next_word.word_lower in SET_MODAL:
+    elif next_word.classes & MODAL:
         self.matched('theyre_are')
         # cur.replace_autocap("they/there")
         # they are being is OK, but there are being is NOT, but they can
@@ -1,10 +1,19 @@
 #!/usr/bin/env python
 
+from ..Units import LEXICON
+KEYWORDS = set(['whom', 'whomever'])
+PASSES = set([1])
+RERUNS = set()
 SET_BE_PRESENT = set(['be', 'am', 'are', 'is'])
 SET_BE_PAST = set(['was', 'were'])
 SET_1 = set(['i', 'me', 'myself'])
 SET_2 = set(['people', 'persons', 'we', 'us', 'you', 'they', 'them'])
 SET_3 = set(['person', 'guy', 'he', 'him', 'she', 'her', 'it'])
+BE_PRESENT = LEXICON.add('whom_be.be_present', SET_BE_PRESENT)
+BE_PAST = LEXICON.add('whom_be.be_past', SET_BE_PAST)
+PERSON_1 = LEXICON.add('whom_be.1', SET_1)
+PERSON_2 = LEXICON.add('whom_be.2', SET_2)
+PERSON_3 = LEXICON.add('whom_be.3', SET_3)
 
 
 def do(self, cur):
@@ -20,22 +29,22 @@ def do(self, cur):
     if not self.sequence.next_has_continuous(1):
         return
     next_word_1 = self.sequence.next_word(1)
-    if next_word_1.word_lower in SET_BE_PRESENT:
+    if next_word_1.classes & BE_PRESENT:
         present = True
-    elif next_word_1.word_lower in SET_BE_PAST:
+    elif next_word_1.classes & BE_PAST:
         present = False
     else:
         return
     if not person:
         if not self.sequence.prev_has_continuous(1, sentences=True):
             return
-        prev_word_1_ = self.sequence.prev_word(1).word_lower
-        if prev_word_1_ in SET_1:
+        prev_word_1 = self.sequence.prev_word(1)
+        if prev_word_1.classes & PERSON_1:
             # Potential issue: the person (sitting across from {me) who is}
             person = 1
-        elif prev_word_1_ in SET_2:
+        elif prev_word_1.classes & PERSON_2:
             person = 2
-        elif prev_word_1_ in SET_3:
+        elif prev_word_1.classes & PERSON_3:
             person = 3
         else:
             return
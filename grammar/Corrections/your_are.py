@@ -1,18 +1,18 @@
 #!/usr/bin/env python
 
+from ..Patterns import Pattern
+from ..Patterns import compile_rule
+from ..Units import LEXICON
+KEYWORDS = set(['your'])
+PASSES = set([1, 11])
+LOOKAHEAD = 1  # next words read when rerunning
+RERUNS = set()
 SET_ARE = set(['are', "aren't"])
+LEXICON.add('your_are.are', SET_ARE)
 
-
-def do(self, cur):
-    """Keyword: your
-    Src: _ are(n't)?
-    Dst: [you] ...
-    Alt: your are[a], your ar[t]
-    """
-    if not self.sequence.next_has_continuous(1):
-        return
-    if self.sequence.next_word(1).word_lower not in SET_ARE:
-        return
-    self.matched('your-are')
-    cur.replace_autocap('you')
-    self.sequence.next_word(1).mark_common()
+# Keyword: your
+# Alt: your are[a], your ar[t]
+do = compile_rule(
+    __name__,
+    Pattern("_ <your_are.are>", "^you ~", 'your-are'),
+)
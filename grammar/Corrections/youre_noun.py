@@ -1,43 +1,36 @@
 #!/usr/bin/env python
 
+from ..Patterns import Pattern
+from ..Patterns import compile_rule
+from ..Units import LEXICON
+KEYWORDS = set(["you're"])
+PASSES = set([1])
+RERUNS = set([10])
 SET_DAY_EXCEPT = set(['dreamers', 'dreaming'])
 SET_LIFE_EXCEPT = set(
     ['saver', 'savers', 'waster', 'wasters', 'changer', 'changers'])
+LEXICON.add('youre_noun.day_except', SET_DAY_EXCEPT)
+LEXICON.add('youre_noun.life_except', SET_LIFE_EXCEPT)
+# Rerun: possessive_as_be for your
+REPLACE = "^your ~"
+RERUN = {10: 0}
 
-
-def do(self, cur):
-    """Keyword: you're
-    Src: _ <possessed_noun:(day|life)|own>
-    Dst: [your] ...
-
-    Removed:
-    (you're man) enough
-    (you're life) changers
-    """
-    if not self.sequence.next_has_continuous(1):
-        return
-    next_word_1 = self.sequence.next_word(1)
-    if next_word_1.word_lower != 'own':
-        if next_word_1.word_lower == 'day':
-            if self.sequence.next_has_continuous(2, 1):
-                # Exception 1: {you're day} dream(ers|ing)
-                if self.sequence.next_word(2).word_lower in SET_DAY_EXCEPT:
-                    return
-        elif next_word_1.word_lower == 'life':
-            if self.sequence.next_has_continuous(2, 1):
-                # Exception 2a: "[you're life] -ing"
-                if self.sequence.next_word(2).is_participle_present():
-                    return
-                # Exception 2b: "[you're life] (sav|wast|chang)ers?"
-                elif self.sequence.next_word(2).word_lower in SET_LIFE_EXCEPT:
-                    return
-                # Allowed: you're life _
-            else:
-                # Exception 3: "you're life." [no following word]
-                return
-        else:
-            return
-    self.matched('your_po')
-    cur.replace_autocap("your")
-    self.rerun.add(10)  # Rerun: possessive_as_be for your
-    next_word_1.mark_common()
+# Keyword: you're
+# Removed:
+# (you're man) enough
+# (you're life) changers
+do = compile_rule(
+    __name__,
+    Pattern("_ own", REPLACE, 'your_po', reruns=RERUN),
+    # Exception 1: {you're day} dream(ers|ing)
+    Pattern("_ day", REPLACE, 'your_po', unless=(
+        "_ day <youre_noun.day_except>",
+    ), reruns=RERUN),
+    # Exception 3: "you're life." [no following word]
+    Pattern("_ life <word>", REPLACE + " =", 'your_po', unless=(
+        # Exception 2a: "[you're life] -ing"
+        "_ life <participle_present>",
+        # Exception 2b: "[you're life] (sav|wast|chang)ers?"
+        "_ life <youre_noun.life_except>",
+    ), reruns=RERUN),
+)
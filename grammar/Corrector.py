@@ -4,183 +4,521 @@
 
 from . import Corrections
 from . import Wording
+from .Transformers import compile_keywords
+from .Transformers import compile_transform
 from .Transformers import partitionize
-from .Transformers import transform
+from .Transformers import partitionize_into
+from .Transformers import transform_offsets
+from .Units import COMMON
+from .Units import LEXICON
 from .Units import SequenceManager
 
 
-class CorrectionManager(object):
+class CorrectionResult(object):
 
-    """This manager takes text as input and creates a list of corrections."""
+    """The detections for a single text, as produced by a batch
 
-    def __init__(self):
-        """Constructor for the manager, which resets the state"""
+    The corrections are only generated when they are accessed, or when the
+    result is pickled. A pickled result only keeps its details if they were
+    accessed before, since they hold the units of the text.
+    """
+
+    def __init__(self, text, corrected, sequence=None, kinds=None):
+        self.text = text  # after transformations
+        self.corrected = corrected
+        self.sequence = sequence
+        self.kinds = kinds
+        self._details = None
+        self._corrections = None
+
+    @property
+    def details(self):
+        """Correction for each of the corrections"""
+        if self._details is None:
+            if not self.corrected or self.sequence is None:
+                return []
+            self._details = generate_details(self.sequence, self.kinds)
+        return self._details
+
+    @property
+    def corrections(self):
+        """List of corrections"""
+        if self._corrections is None:
+            self._corrections = [correction.render()
+                                 for correction in self.details]
+        return self._corrections
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_corrections'] = self.corrections
+        state['sequence'] = None
+        return state
+
+    def __bool__(self):
+        return bool(self.corrected)
+    __nonzero__ = __bool__
+
+
+class Correction(object):
+
+    """A detection: some corrected units, in their context window"""
+
+    def __init__(self, units, start, opens, closes, punctuation, kinds):
+        self.units = units  # context window
+        self.start = start  # index of the first unit in the sequence
+        self.end = start + len(units)
+        self.opens = opens
+        self.closes = closes
+        self.punctuation = punctuation  # '?', '!' or ''
+        # (index, kind, original, replacement) for each corrected unit
+        self.changes = [(index, kinds.get(index), unit.original, unit.new_text)
+                        for index, unit in enumerate(units, start) if unit.flags == 1]
+
+    def get_indices(self):
+        """Return the indices of the corrected units in the sequence"""
+        return [change[0] for change in self.changes]
+
+    def get_kinds(self):
+        """Return the kinds of corrections, in order and without repetitions"""
+        kinds = []
+        for change in self.changes:
+            if change[1] not in kinds:
+                kinds.append(change[1])
+        return kinds
+
+    def get_original(self):
+        """Return the original text of the context window"""
+        return u''.join(unit.original for unit in self.units)
+
+    def get_replacement(self):
+        """Return the corrected text of the context window"""
+        return u''.join(unit.get_final() for unit in self.units)
+
+    def render(self):
+        """Return the context window with the corrected words in brackets"""
+        text = []
+        for index, unit in enumerate(self.units, self.start):
+            if index in self.opens:
+                text.append('[')
+            text.append(unit.get_final())
+            if index in self.closes:
+                text.append(']')
+        text.append(self.punctuation)
+        return ''.join(text)
+    __str__ = render
+
+    def as_dict(self):
+        """Return the correction as a dict of JSON types"""
+        return {
+            'kinds': self.get_kinds(),
+            'start': self.start,
+            'end': self.end,
+            'original': self.get_original(),
+            'replacement': self.get_replacement(),
+            'changes': [list(change) for change in self.changes],
+            'text': self.render(),
+        }
+
+
+def generate_details(sequence, kinds):
+    """Return a Correction for each group of corrected units in a sequence"""
+    details = []
+    sequence_len = len(sequence)
+
+    current_start = None
+    current_end = None
+    opens = []  # corrected words after '['
+    closes = []  # corrected words before ']'
+
+    # Include: [corrected],common{0,2},near (on both sides)
+    # Allow one gap: [included] [[word]] [included]
+    # Add special punctuation: [final word] [?!]
+    for i in range(0, sequence_len + 1, 2):
+        if i == sequence_len or sequence[i].flags == 1:
+            this_start = i
+            this_end = i
+            if i != sequence_len:
+                # left check
+                while this_start:  # at least one word before
+                    if sequence[this_start - 1].sentenceBreaker:
+                        # wall on left
+                        break
+                    if current_end is not None and this_start <= current_end + 4:
+                        # overlap
+                        break
+                    this_start -= 2
+                    word = sequence[this_start]
+                    if word.flags != 2 and not word.classes & COMMON:  # is_common
+                        if not word.is_near():
+                            this_start += 2
+                        break
+                    if this_start + 6 == i:
+                        # reached limit (3 words)
+                        break
+                # right check
+                while this_end + 2 < sequence_len:
+                    # at least one word after
+                    if sequence[this_end + 1].sentenceBreaker:
+                        # wall on right
+                        break
+                    this_end += 2
+                    if sequence[this_end].flags == 1:
+                        # don't parse the corrected word yet
+                        this_end -= 2
+                        break
+                    word = sequence[this_end]
+                    if word.flags != 2 and not word.classes & COMMON:  # is_common
+                        if not word.is_near():
+                            this_end -= 2
+                        break
+                    if this_end == i + 6:
+                        # reached limit (3 words)
+                        break
+            # overlap
+            if i != sequence_len and current_end is not None and this_start <= current_end + 4:
+                # merge ranges
+                if sequence[current_end].flags != 1:
+                    opens.append(i)
+                if i + 2 == sequence_len or sequence[i + 2].flags != 1:
+                    closes.append(i)
+                if this_end > current_end:
+                    current_end = this_end
+            else:
+                # previous range
+                if current_end is not None:
+                    last_punctuation = sequence[
+                        current_end + 1].get_final()[:1]
+                    if last_punctuation not in '?!':
+                        last_punctuation = ''
+                    details.append(Correction(
+                        sequence[current_start:current_end + 1], current_start,
+                        opens, closes, last_punctuation, kinds))
+                if i != sequence_len:
+                    # set to current range
+                    current_start = this_start
+                    current_end = this_end
+                    opens = [i]
+                    closes = []
+                    if i + 2 == sequence_len or sequence[i + 2].flags != 1:
+                        closes.append(i)
+    return details
+
+
+class CheckState(object):
+
+    """The detections of a single check, which the rules change
+
+    The rules are called with the state as their first argument, and read
+    its sequence.
+    """
+
+    def __init__(self, dispatch, sequence=None, detect_only=False):
+        self.dispatch = dispatch  # shared tables, see Corrections.DISPATCH
+        self.detect_only = detect_only
         self.reset()
+        self.sequence = sequence
 
     def reset(self):
         """Reset the state"""
-        self.corrections = []
         self.sequence = None
         self.corrected = {}
-        self.rerun = set([1])  # 0 = done, 1 = initial run, 2+ = rerun groups
-
-    def load_text(self, text, **options):
-        """Load some text into the state and return whether there are detections"""
-        text = transform(text, **options)
-        self.sequence = SequenceManager(partitionize(text))
-        # Do checks
-        self.do_checks_all()
-        # Were there any corrections?
-        if not self.corrected:
-            return False
-        # Generate texts and return
-        return self.generate_texts()  # False should never occur
+        self.rerun = {}  # position -> rerun groups (10+) to check there
+        self.kinds = {}  # position -> kind of the correction that changed it
+        self.matching = None  # (kind, texts around the position) being corrected
 
     def matched(self, kind):
         """Flag a type of correction"""
         self.corrected[kind] = True
+        if self.detect_only:
+            return
+        # the rules only change units within two words of the position
+        position = self.sequence.position
+        self.matching = kind, [unit.new_text for unit in
+                               self.sequence[max(0, position - 4):position + 5]]
+
+    def tag_changes(self):
+        """Remember the kind of correction of the units that were just changed"""
+        kind, texts = self.matching
+        self.matching = None
+        start = max(0, self.sequence.position - 4)
+        for position, new_text in enumerate(texts, start):
+            if self.sequence[position].new_text != new_text:
+                self.kinds[position] = kind
+
+    def rerun_at(self, group, position):
+        """Recheck a rerun group where it can see the word at a position"""
+        start = max(0, position - 2 * Corrections.RERUN_REACH[group])
+        for position in range(start, position + 1, 2):
+            self.rerun.setdefault(position, set()).add(group)
 
     def do_checks_all(self):
-        """Repeat checks until nothing is detected"""
+        """Check every word, then recheck around changes until nothing is detected"""
+        dispatch = self.dispatch[frozenset([1])]
+        for cur in self.sequence.iter_words():
+            self.do_checks(dispatch, cur)
         while self.rerun:
-            current_rerun = self.rerun
-            self.rerun = set()
-            for cur in self.sequence.iter_words():
+            rerun = self.rerun
+            self.rerun = {}
+            for cur in self.sequence.iter_positions(sorted(rerun)):
                 self.do_checks(
-                    current_rerun=current_rerun,
-                    cur=cur,
-                )
-
-    SET_possessive_as_be = set(['its', 'your', 'whose'])
-
-    def do_checks(self, current_rerun, cur):
-        if 1 in current_rerun:
-            # First pass
-            if cur.word_lower in self.SET_possessive_as_be:
-                # conflicts with 'whose'
-                Corrections.possessive_as_be.do(self, cur)
-            if cur.word_lower == "you're":
-                Corrections.youre_noun.do(self, cur)
-            elif cur.word_lower == 'own':
-                Corrections.its_own.do(self, cur)
-                Corrections.there_own.do(self, cur)
-            # elif cur.word_lower == 'going':
-            # Corrections.im_going.do(self, cur) # DISABLED
-            elif cur.word_lower == 'whose':
-                Corrections.whose_been.do(self, cur)
-            elif cur.word_lower == "they're":
-                Corrections.theyre_be.do(self, cur)
-            elif cur.word_lower == "their":
-                Corrections.their_modal.do(self, cur)
-            elif cur.word_lower == "hear" or cur.word_lower == "board":
-                Corrections.be_noun.do(self, cur)
-            elif cur.word_lower == "then":
-                Corrections.then.do(self, cur)
-            elif cur.word_lower == "than":
-                Corrections.than.do(self, cur)
-            elif cur.word_lower == "of":
-                Corrections.of.do(self, cur)
-            elif cur.word_lower == "your":
-                Corrections.your_are.do(self, cur)
-            elif cur.word_lower == "supposed":
-                Corrections.supposed_to.do(self, cur)
-            elif cur.word_lower == "whom" or cur.word_lower == "whomever":
-                Corrections.whom_be.do(self, cur)
+                    self.dispatch[frozenset(rerun[self.sequence.position])], cur)
+
+    def do_checks(self, dispatch, cur):
+        """Run the rules triggered by the current word"""
+        word = cur.word_lower
+        for rule in dispatch.get(word, ()):
+            rule(self, cur)
+            if self.matching is not None:
+                self.tag_changes()
+            if cur.word_lower != word:
+                # corrected, so the other rules are no longer triggered
+                break
+
+
+class Rules(object):
+
+    """The rules, and the keywords without which none of them is triggered
+
+    Checker and CorrectionManager both check the texts with these, and the
+    rules themselves run in CheckState.do_checks_all.
+    """
+
+    # Texts without any keyword are rejected before they are partitioned
+    # (set to None to always run the full checks)
+    prefilter = compile_keywords(Corrections.KEYWORDS)
+
+    # Rules to run for each set of passes, then for each keyword
+    dispatch = Corrections.DISPATCH
+
+    def rejects(self, text):
+        """Return whether no rule can be triggered by some transformed text"""
+        return self.prefilter is not None and not self.prefilter.search(text)
+
+
+class Checker(Rules):
+
+    """The rules and the transformations, shared by any number of threads
+
+    Nothing in a checker changes once it is created: each check has its own
+    CheckState and its own units, so the same checker can check texts in
+    many threads at once, without any lock.
+    """
+
+    def __init__(self, detect_only=False, **options):
+        """Compile the transformations of the options (see compile_transform)"""
+        self.detect_only = detect_only
+        self.options = options
+        self.transform = compile_transform(**options)
+
+    def check(self, text):
+        """Return the CorrectionResult of some text"""
+        return self.check_transformed(self.transform(text))
+
+    def check_transformed(self, text):
+        """Return the CorrectionResult of some already transformed text"""
+        if self.rejects(text):
+            return CorrectionResult(text, {})
+        state = CheckState(self.dispatch, SequenceManager(partitionize(text)),
+                           self.detect_only)
+        state.do_checks_all()
+        if not state.corrected or self.detect_only:
+            return CorrectionResult(text, state.corrected)
+        return CorrectionResult(text, state.corrected, state.sequence, state.kinds)
+
+    def check_batch(self, texts):
+        """Return a list of CorrectionResult for some texts"""
+        return [self.check(text) for text in texts]
+
+
+class CorrectionManager(CheckState, Rules):
+
+    """This manager takes text as input and creates a list of corrections.
+
+    A manager is the state of the text it checked last, so each thread needs
+    its own; a Checker can be shared instead.
+    """
+
+    # Returns the function that performs the transformations
+    compile_transform = staticmethod(compile_transform)
+
+    def __init__(self, detect_only=False, pooled=False, cache=None):
+        """Constructor for the manager, which resets the state
+
+        With detect_only, only the kinds of corrections are detected, and the
+        corrections themselves are not available. With pooled, the units and
+        the sequence are kept and reinitialised for the next texts, unless
+        corrections may still use them. With a cache (see grammar.Caching),
+        the results are reused for texts that were already checked.
+        """
+        self.pooled = pooled
+        self.cache = cache
+        self.pool = []  # Word and Space units for the next texts
+        self.buffer = None  # SequenceManager for the next texts
+        self.shared = False  # whether the units may be used outside
+        super(CorrectionManager, self).__init__(self.dispatch, detect_only=detect_only)
+
+    def reset(self):
+        """Reset the state"""
+        if self.shared:
+            # corrections outside keep the units, so the next texts need others
+            self.pool = []
+            self.buffer = None
+            self.shared = False
+        super(CorrectionManager, self).reset()
+        self._corrections = None  # generated when needed
+        self._details = None
+        self.source = None  # before transformations
+        self.options = {}
+        self.offsets = None  # OffsetMap, only built when needed
+
+    def load_text(self, text, **options):
+        """Load some text into the state and return whether there are detections"""
+        self.source = text
+        self.options = options
+        return self.load_transformed(self.compile_transform(**options)(text))
+
+    def load_transformed(self, text):
+        """Load some already transformed text and return whether there are detections"""
+        if self.rejects(text):
+            self.sequence = None
+            return False
+        if self.cache is not None:
+            # the results only depend on the transformed text and the lexicon
+            key = (text, self.detect_only, LEXICON.generation)
+            result = self.cache.get(key)
+            if result is not None:
+                return self.load_result(result)
+        self.partition(text)
+        # Do checks
+        self.do_checks_all()
+        if self.detect_only:
+            self.sequence = None
+        if self.cache is not None:
+            if self.corrected and self.sequence is not None:
+                # the cache keeps the units
+                self.shared = self.pooled
+                self.cache.set(key, CorrectionResult(
+                    text, dict(self.corrected), self.sequence, self.kinds))
+            else:
+                self.cache.set(key, CorrectionResult(text, dict(self.corrected)))
+        # Were there any corrections? (they are generated when needed)
+        return bool(self.corrected)
+
+    def load_result(self, result):
+        """Load the detections of a CorrectionResult and return whether there are any"""
+        self.corrected = dict(result.corrected)
+        self.sequence = result.sequence
+        self.kinds = result.kinds if result.kinds is not None else {}
+        if result.sequence is None and result.corrected and not self.detect_only:
+            # only the corrections were kept
+            self._corrections = list(result.corrections)
+        return bool(self.corrected)
+
+    def partition(self, text):
+        """Partition some text into the sequence of units"""
+        if self.pooled:
+            self.load_pooled(text)
         else:
-            if 10 in current_rerun:
-                # Caused by: youre_noun, its_own, there_own
-                if cur.word_lower in self.SET_possessive_as_be:
-                    Corrections.possessive_as_be.do(self, cur)
-            if 11 in current_rerun:
-                # Caused by: supposed_to
-                if cur.word_lower == 'your':
-                    Corrections.your_are.do(self, cur)
+            self.sequence = SequenceManager(partitionize(text))
+
+    def load_pooled(self, text):
+        """Partition some text into the units and the sequence of the pool"""
+        count = partitionize_into(text, self.pool)
+        if self.buffer is None:
+            self.buffer = SequenceManager()
+        self.buffer.load(self.pool[:count])
+        self.sequence = self.buffer
+
+    def load_texts(self, texts, **options):
+        """Check each text in turn, yielding a CorrectionResult for each one
+
+        The options are only processed once for the whole batch.
+        """
+        transform_ = self.compile_transform(**options)
+        for text in texts:
+            self.reset()
+            self.source = text
+            self.options = options
+            text = transform_(text)
+            if self.load_transformed(text) and self.sequence is not None:
+                self.shared = self.pooled
+            result = CorrectionResult(text, self.corrected,
+                                      self.sequence if self.corrected else None, self.kinds)
+            if self.sequence is None:
+                # loaded from a cache that only kept the corrections
+                result._corrections = self._corrections
+            yield result
+
+    def check_batch(self, texts, **options):
+        """Return a list of CorrectionResult for some texts
+
+        All the results are kept until the end, so large batches are faster
+        with load_texts.
+        """
+        return list(self.load_texts(texts, **options))
+
+    def get_offsets(self):
+        """Return the OffsetMap from the transformed text to the loaded text"""
+        if self.offsets is None:
+            self.offsets = transform_offsets(self.source, **self.options)[1]
+        return self.offsets
+
+    def get_spans(self):
+        """Return (start, end, replacement) for each corrected word
+
+        The offsets are into the text given to load_text, before it was
+        transformed, so text[start:end] is the word that was corrected.
+        """
+        if not self.corrected or self.sequence is None:
+            return []
+        if self.source is None:
+            # loaded with load_transformed
+            offsets = None
+        else:
+            offsets = self.get_offsets()
+        spans = []
+        for unit in self.sequence:
+            if unit.flags == 1:
+                start, end = unit.start, unit.get_end()
+                if offsets is not None:
+                    start, end = offsets.span(start, end)
+                spans.append((start, end, unit.new_text))
+        return spans
+
+    def generate_details(self):
+        """Generate a list of Correction, without assembling their texts"""
+        self._details = generate_details(self.sequence, self.kinds)
+        return self._details
 
     def generate_texts(self):
         """Generate a list of corrections"""
-        self.corrections = []
-        sequence = list(self.sequence)  # convert the SequenceManager to a list
-        sequence_len = len(sequence)
-
-        current_correction = []
-        current_end = None
-
-        # Include: [corrected],common{0,2},near (on both sides)
-        # Allow one gap: [included] [[word]] [included]
-        # Add special punctuation: [final word] [?!]
-        for i in range(0, sequence_len + 1, 2):
-            if i == sequence_len or sequence[i].flags == 1:
-                this_start = i
-                this_end = i
-                if i != sequence_len:
-                    # left check
-                    while this_start:  # at least one word before
-                        if sequence[this_start - 1].sentenceBreaker:
-                            # wall on left
-                            break
-                        if current_end is not None and this_start <= current_end + 4:
-                            # overlap
-                            break
-                        this_start -= 2
-                        if not sequence[this_start].is_common():
-                            if not sequence[this_start].is_near():
-                                this_start += 2
-                            break
-                        if this_start + 6 == i:
-                            # reached limit (3 words)
-                            break
-                    # right check
-                    while this_end + 2 < sequence_len:
-                        # at least one word after
-                        if sequence[this_end + 1].sentenceBreaker:
-                            # wall on right
-                            break
-                        this_end += 2
-                        if sequence[this_end].flags == 1:
-                            # don't parse the corrected word yet
-                            this_end -= 2
-                            break
-                        if not sequence[this_end].is_common():
-                            if not sequence[this_end].is_near():
-                                this_end -= 2
-                            break
-                        if this_end == i + 6:
-                            # reached limit (3 words)
-                            break
-                # overlap
-                if i != sequence_len and current_end is not None and this_start <= current_end + 4:
-                    # merge ranges
-                    current_correction.extend(
-                        map(str, sequence[current_end + 1: i]))
-                    if sequence[current_end].flags != 1:
-                        current_correction.append('[')
-                    current_correction.append(str(sequence[i]))
-                    if i + 2 == sequence_len or sequence[i + 2].flags != 1:
-                        current_correction.append(']')
-                    if this_end > current_end:
-                        current_correction.extend(
-                            map(str, sequence[i + 1:this_end + 1]))
-                        current_end = this_end
-                else:
-                    # previous range
-                    if current_end is not None:
-                        last_punctuation = sequence[
-                            current_end + 1].get_final()[:1]
-                        if last_punctuation in '?!':
-                            current_correction.append(last_punctuation)
-                        self.corrections.append(''.join(current_correction))
-                    else:
-                        current_end = this_start
-                    if i != sequence_len:
-                        # set to current range
-                        current_correction = list(
-                            map(str, sequence[this_start: i])) + ['[', str(sequence[i])]
-                        if i + 2 == sequence_len or sequence[i + 2].flags != 1:
-                            current_correction.append(']')
-                        current_correction.extend(
-                            list(map(str, sequence[i + 1:this_end + 1])))
-                        current_end = this_end
-        return bool(self.corrections)  # len(self.corrections) > 0
+        self._corrections = [correction.render()
+                             for correction in self.generate_details()]
+        return bool(self._corrections)  # len(self.corrections) > 0
+
+    @property
+    def details(self):
+        """Correction for each of the corrections, generated on first access"""
+        if self._details is None:
+            if not self.corrected or self.sequence is None:
+                return []
+            self.generate_details()
+        self.shared = self.pooled
+        return self._details
+
+    @property
+    def corrections(self):
+        """List of corrections, generated on first access"""
+        if self._corrections is None:
+            if not self.corrected or self.sequence is None:
+                return []
+            self.generate_texts()
+        return self._corrections
+
+    @corrections.setter
+    def corrections(self, corrections):
+        """Replace the corrections, or generate them again when set to None"""
+        self._corrections = corrections
 
     def generate(self, user, callback):
         """ Output a random message for the corrections"""
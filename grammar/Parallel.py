@@ -0,0 +1,143 @@
+#!/usr/bin/env python
+
+"""Parallel checker: a pool of processes, each with its own CorrectionManager"""
+
+from itertools import islice
+import multiprocessing
+import threading
+
+from .Caching import DiskCache
+from .Corrector import CorrectionManager
+from .Corrector import CorrectionResult
+
+try:
+    from itertools import izip as zip
+except ImportError:  # pragma: no cover
+    pass
+
+# State of a worker process
+worker_parser = None
+worker_options = None
+worker_details = False
+
+
+def init_worker(options, cache_path=None, details=False):
+    """Create the long-lived manager of a worker process"""
+    global worker_parser, worker_options, worker_details
+    worker_parser = CorrectionManager(
+        cache=DiskCache(cache_path) if cache_path else None)
+    worker_options = options
+    worker_details = details
+
+
+def check_chunk(chunk):
+    """Check a chunk of texts in a worker process
+
+    Return the index of the first text, and for each text a tuple of its
+    transformed text (None if unchanged), corrected, kinds, corrections and
+    details (None unless requested), which are cheaper to send back than
+    the results.
+    """
+    start, texts = chunk
+    results = worker_parser.check_batch(texts, **worker_options)
+    if worker_parser.cache is not None:
+        # for the other workers
+        worker_parser.cache.flush()
+    return start, [(None if result.text == text else result.text, result.corrected,
+                    result.kinds, result.corrections,
+                    result.details if worker_details else None)
+                   for result, text in zip(results, texts)]
+
+
+def load_chunk(texts, states):
+    """Return the CorrectionResult of each text of a chunk, from check_chunk"""
+    results = []
+    for text, (transformed, corrected, kinds, corrections, details) in zip(texts, states):
+        result = CorrectionResult(text if transformed is None else transformed,
+                                  corrected, kinds=kinds)
+        result._corrections = corrections
+        result._details = details
+        results.append(result)
+    return results
+
+
+def iter_chunks(texts, chunksize):
+    """Yield (index of the first text, list of texts) for each chunk"""
+    texts = iter(texts)
+    start = 0
+    while True:
+        chunk = list(islice(texts, chunksize))
+        if not chunk:
+            return
+        yield start, chunk
+        start += len(chunk)
+
+
+class ParallelChecker(object):
+
+    """This checker shards texts across a pool of processes."""
+
+    def __init__(self, processes=None, chunksize=256, cache_path=None, details=False,
+                 max_pending=None, **options):
+        """Start the worker processes (default: one per CPU)
+
+        With a cache_path, the workers share a DiskCache in that file. The
+        results only have their corrections and their kinds, unless details
+        is true: the details are sent back with the units of their texts,
+        which costs more than checking them. At most max_pending chunks
+        (default: two per process) are read ahead of the results.
+        """
+        self.chunksize = chunksize
+        self.max_pending = max_pending or 2 * (processes or multiprocessing.cpu_count())
+        self.pool = multiprocessing.Pool(
+            processes, init_worker, (options, cache_path, details))
+
+    def map_chunks(self, imap, texts):
+        """Yield (index of the first text, results) for each chunk of texts checked by imap
+
+        The texts are only read when fewer than max_pending chunks are waiting.
+        """
+        pending = threading.Semaphore(self.max_pending)
+        stopped = []
+        chunks = iter_chunks(texts, self.chunksize)
+        sent = {}  # index of the first text -> texts
+
+        def bounded():
+            # read by the thread of the pool which submits the tasks
+            while True:
+                pending.acquire()
+                chunk = None if stopped else next(chunks, None)
+                if chunk is None:
+                    return
+                sent[chunk[0]] = chunk[1]
+                yield chunk
+        try:
+            for start, states in imap(check_chunk, bounded()):
+                pending.release()
+                yield start, load_chunk(sent.pop(start), states)
+        finally:
+            stopped.append(True)
+            pending.release()
+
+    def check(self, texts):
+        """Yield a CorrectionResult for each text, in input order"""
+        for start, results in self.map_chunks(self.pool.imap, texts):
+            for result in results:
+                yield result
+
+    def check_unordered(self, texts):
+        """Yield (index, CorrectionResult) for each text, as soon as it is ready"""
+        for start, results in self.map_chunks(self.pool.imap_unordered, texts):
+            for i, result in enumerate(results, start):
+                yield i, result
+
+    def close(self):
+        """Stop the worker processes"""
+        self.pool.close()
+        self.pool.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
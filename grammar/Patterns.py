@@ -0,0 +1,308 @@
+#!/usr/bin/env python
+
+"""Patterns of words for the correction rules, compiled to matchers
+
+A pattern has a token for each word, separated by spaces:
+
+    _             the keyword that triggers the rule
+    [token]       the keyword, if it matches the token
+    word          the word itself (in lowercase)
+    <class>       a word of a class, from the rule, CLASSES or the lexicon
+    <word>        any word
+    a|b|<class>   any of these words or classes
+    !token        a word that does not match the token
+    token?        an optional word
+    ...           any number of words (a window, before the keyword only)
+
+Every word has to be in the same block as the keyword, and the words before
+a window can be anywhere in that block. A pattern gives the change of each
+of its words, except those before a window:
+
+    =             no change
+    ~             a common word of the correction
+    word          the new word
+    ^word         the new word, capitalized like the old one
+"""
+
+from itertools import product
+
+from .Units import LEXICON
+
+# Classes of words that are not in the lexicon: predicates of Word
+CLASSES = {
+    'allcaps': lambda word: word.caps == 2,
+    'participle_present': lambda word: word.word_lower.endswith('ing'),
+}
+
+
+class PatternError(ValueError):
+    pass
+
+
+class Token(object):
+
+    """A test on a single word"""
+
+    def __init__(self, text, classes):
+        self.text = text
+        self.negated = text.startswith('!')
+        words = set()
+        predicates = []
+        self.mask = 0  # classes of the lexicon
+        self.any = False
+        for alternative in text.lstrip('!').split('|'):
+            if alternative == '<word>':
+                self.any = True
+            elif alternative.startswith('<') and alternative.endswith('>'):
+                name = alternative[1:-1]
+                if name in classes:
+                    value = classes[name]
+                    if callable(value):
+                        predicates.append(value)
+                    else:
+                        words.update(value)
+                elif name in LEXICON.bits:
+                    self.mask |= LEXICON.get_bit(name)
+                else:
+                    raise PatternError('unknown class %s' % alternative)
+            elif alternative:
+                words.add(alternative.lower())
+            else:
+                raise PatternError('empty alternative in %s' % text)
+        self.words = frozenset(words)
+        self.predicates = tuple(predicates)
+        self.parts = bool(self.words) + bool(self.mask) + len(self.predicates)
+
+    def compile(self, unit, namespace):
+        """Return the source of the test of a unit, adding its values to a namespace"""
+        if self.any:
+            return 'False' if self.negated else 'True'
+        tests = []
+        if len(self.words) == 1:
+            tests.append('%s.word_lower == %r' % (unit, next(iter(self.words))))
+        elif self.words:
+            name = 'words%d' % len(namespace)
+            namespace[name] = self.words
+            tests.append('%s.word_lower in %s' % (unit, name))
+        if self.mask:
+            tests.append('%s.classes & %d' % (unit, self.mask))
+        for predicate in self.predicates:
+            name = 'predicate%d' % len(namespace)
+            namespace[name] = predicate
+            tests.append('%s(%s)' % (name, unit))
+        test = ' or '.join(tests)
+        if self.negated:
+            return 'not (%s)' % test
+        return '(%s)' % test if len(tests) > 1 else test
+
+
+class Pattern(object):
+
+    """A sequence of tokens around the keyword, with the changes to make
+
+    The pattern does not match when any of the patterns in unless does.
+    reruns maps rerun groups to the word (relative to the keyword) where
+    they have to be checked again. With first_word, the first word of the
+    text is in the block of the keyword when that block starts at the second
+    word, as in prev_get_words_continuous.
+    """
+
+    def __init__(self, src, dst=None, kind=None, unless=(), reruns=None, classes=None,
+                 first_word=False):
+        self.src = src
+        self.kind = kind
+        self.first_word = first_word
+        self.reruns = sorted((reruns or {}).items())
+        if classes:
+            classes = dict(CLASSES, **classes)
+        else:
+            classes = CLASSES
+        self.unless = [Pattern(pattern, classes=classes, first_word=first_word)
+                       for pattern in unless]
+        tokens = src.split()
+        if tokens.count('...') > 1:
+            raise PatternError('more than one window in %s' % src)
+        window = tokens.index('...') if '...' in tokens else None
+        floating = tokens[:window] if window is not None else []
+        fixed = tokens[window + 1:] if window is not None else tokens
+        anchors = [i for i, token in enumerate(fixed)
+                   if token == '_' or token.startswith('[')]
+        if len(anchors) != 1:
+            raise PatternError('no single keyword in %s' % src)
+        anchor = anchors[0]
+        if dst is None:
+            changes = ['='] * len(fixed)
+        else:
+            changes = dst.split()
+            if len(changes) != len(fixed):
+                raise PatternError('%s has no change for each word of %s' % (dst, src))
+        self.floating = [Token(token, classes) for token in floating]
+        if any(token.endswith('?') for token in floating):
+            raise PatternError('optional word before a window in %s' % src)
+        # each combination of the optional words is a pattern of its own
+        words = []
+        for i, (token, change) in enumerate(zip(fixed, changes)):
+            if i == anchor:
+                token = '<word>' if token == '_' else token[1:-1]
+                keyword = Token(token, classes)
+                if keyword.any or keyword.negated or keyword.mask or keyword.predicates:
+                    self.keywords = None  # any keyword
+                else:
+                    self.keywords = keyword.words
+                words.append([(0, token, change)])
+            elif token.endswith('?'):
+                words.append([(i - anchor, token[:-1], change), None])
+            else:
+                words.append([(i - anchor, token, change)])
+        self.variants = []
+        for variant in product(*words):
+            variant = [word for word in variant if word is not None]
+            anchor = [offset for offset, token, change in variant].index(0)
+            self.variants.append((
+                anchor,  # words before the keyword
+                len(variant) - anchor - 1,  # words after the keyword
+                [(2 * (i - anchor), Token(token, classes))
+                 for i, (offset, token, change) in enumerate(variant)
+                 if token != '<word>'],
+                [(2 * (i - anchor), change)
+                 for i, (offset, token, change) in enumerate(variant)
+                 if change != '='],
+            ))
+        if window is not None and len(self.variants) > 1:
+            raise PatternError('optional word with a window in %s' % src)
+        self.match_at = self.compile()
+        self.match_words = None  # without the exceptions, see explain
+
+    def compile(self, exceptions=True):
+        """Return the function that matches the pattern at a position
+
+        The function returns the changes of the first matching variant, or
+        None. Its source only has the tests of the words of the pattern, and
+        of the exceptions unless exceptions is False.
+        """
+        namespace = {}
+        lines = ['def match(sequence, position, prev_words, next_words):']
+        if self.first_word:
+            lines.append('    if prev_words == (position >> 1) - 1:')
+            lines.append('        prev_words += 1  # across the breaker after it')
+        for i, (before, after, tests, changes) in enumerate(self.variants):
+            namespace['changes%d' % i] = changes
+            conditions = []
+            if before:
+                conditions.append('prev_words >= %d' % before)
+            if after:
+                conditions.append('next_words >= %d' % after)
+            indent = '    '
+            for offset, token in tests:
+                unit = 'sequence[position %+d]' % offset
+                if token.parts > 1:
+                    # the word is tested several times
+                    if conditions:
+                        lines.append('%sif %s:' % (indent, ' and '.join(conditions)))
+                        indent += '    '
+                        conditions = []
+                    lines.append('%sunit = %s' % (indent, unit))
+                    unit = 'unit'
+                conditions.append(token.compile(unit, namespace))
+            if conditions:
+                lines.append('%sif %s:' % (indent, ' and '.join(conditions)))
+                indent += '    '
+            if self.floating:
+                # from the nearest possible start to the farthest word of the block
+                lines.append('%sfor start in range(position - %d, position - 2 * prev_words - 2, -2):' % (
+                    indent, 2 * (before + len(self.floating))))
+                lines.append('%s    if %s:' % (indent, ' and '.join(
+                    token.compile('sequence[start + %d]' % (2 * j), namespace)
+                    for j, token in enumerate(self.floating))))
+                lines.append('%s        break' % indent)
+                lines.append('%selse:' % indent)
+                lines.append('%s    start = None' % indent)
+                lines.append('%sif start is not None:' % indent)
+                indent += '    '
+            for j, pattern in enumerate(self.unless if exceptions else ()):
+                namespace['unless%d' % j] = pattern.match_at
+                lines.append('%sif unless%d(sequence, position, prev_words, next_words) is not None:' % (indent, j))
+                lines.append('%s    return None' % indent)
+            lines.append('%sreturn changes%d' % (indent, i))
+        lines.append('    return None')
+        exec(compile('\n'.join(lines), '<pattern %s>' % self.src, 'exec'), namespace)
+        return namespace['match']
+
+    def match(self, sequence):
+        """Return the changes of the first variant matching at the current word, or None"""
+        position = sequence.position
+        return self.match_at(sequence, position, sequence.prev_any[position >> 1],
+                             sequence.next_any[position >> 1])
+
+    def explain(self, sequence, position, prev_words, next_words):
+        """Return the exception that stops a match at a position, or None"""
+        if self.match_words is None:
+            self.match_words = self.compile(exceptions=False)
+        if self.match_words(sequence, position, prev_words, next_words) is None:
+            return None
+        for pattern in self.unless:
+            if pattern.match_at(sequence, position, prev_words, next_words) is not None:
+                return pattern
+        return None
+
+    def apply(self, manager, changes):
+        """Make the changes of a match, at the current word"""
+        manager.matched(self.kind)
+        sequence = manager.sequence
+        position = sequence.position
+        for offset, change in changes:
+            word = sequence[position + offset]
+            if change == '~':
+                word.mark_common()
+            elif change.startswith('^'):
+                word.replace_autocap(change[1:])
+            else:
+                word.replace(change)
+        for group, offset in self.reruns:
+            manager.rerun_at(group, position + 2 * offset)
+
+
+def compile_rule(name, *patterns):
+    """Return the function of a rule, which applies the first matching pattern
+
+    The name of the rule module is given to the function, for the profiling,
+    along with explain(manager, cur), which returns the exception that
+    stopped the rule at the current word, or None when no pattern matched.
+    """
+    # the patterns that can match each keyword, in order
+    keywords = set()
+    for pattern in patterns:
+        keywords.update(pattern.keywords or ())
+    matchers = dict((keyword, [(pattern.match_at, pattern.apply) for pattern in patterns
+                               if pattern.keywords is None or keyword in pattern.keywords])
+                    for keyword in keywords)
+    default = [(pattern.match_at, pattern.apply) for pattern in patterns
+               if pattern.keywords is None]
+
+    def do(self, cur):
+        sequence = self.sequence
+        position = sequence.position
+        prev_words = sequence.prev_any[position >> 1]
+        next_words = sequence.next_any[position >> 1]
+        for match, apply in matchers.get(cur.word_lower, default):
+            changes = match(sequence, position, prev_words, next_words)
+            if changes is not None:
+                apply(self, changes)
+                return
+
+    def explain(self, cur):
+        sequence = self.sequence
+        position = sequence.position
+        prev_words = sequence.prev_any[position >> 1]
+        next_words = sequence.next_any[position >> 1]
+        for pattern in patterns:
+            if pattern.keywords is None or cur.word_lower in pattern.keywords:
+                exception = pattern.explain(sequence, position, prev_words, next_words)
+                if exception is not None:
+                    return exception
+        return None
+    do.__module__ = name
+    do.__doc__ = '\n'.join(pattern.src for pattern in patterns)
+    do.patterns = patterns
+    do.explain = explain
+    return do
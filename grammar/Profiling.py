@@ -0,0 +1,227 @@
+#!/usr/bin/env python
+
+"""Profiling manager: counters and timings for each rule and each stage"""
+
+import linecache
+import sys
+from timeit import default_timer as timer
+
+from . import Corrections
+from .Corrector import CorrectionManager
+
+# Stages of the pipeline, as timed by ProfilingCorrectionManager
+STAGES = ('transform', 'partitionize', 'do_checks_all',
+          'generate_details', 'generate_texts')
+
+
+def rule_name(rule):
+    """Return the name of the module of a rule function"""
+    return rule.__module__.rsplit('.', 1)[-1]
+
+
+def exit_reason(code, line):
+    """Return the source of the condition that made a rule return at a line"""
+    source = linecache.getline(code.co_filename, line).strip()
+    if source != 'return' and not source.startswith('return '):
+        return source
+    # the condition is just before, possibly on several lines
+    condition = []
+    for line in range(line - 1, max(code.co_firstlineno, line - 5), -1):
+        source = linecache.getline(code.co_filename, line).strip()
+        condition.insert(0, source)
+        if source.startswith(('if ', 'elif ', 'else', 'for ', 'while ')):
+            break
+    return ' '.join(condition)
+
+
+def pattern_exits(rule):
+    """Return {pattern: (line, source)} for the patterns and the exceptions of a compiled rule
+
+    The line is that of the pattern in the source of the rule module. The
+    key None (no pattern matched the words) has the line of the
+    compile_rule call.
+    """
+    filename = sys.modules[rule.__module__].__file__
+    if filename.endswith(('.pyc', '.pyo')):
+        filename = filename[:-1]
+    source = linecache.getlines(filename)
+
+    def find(text):
+        for line, source_line in enumerate(source, 1):
+            if text in source_line:
+                return line, source_line.strip()
+        return 0, text
+    exits = {None: (find('compile_rule(')[0], 'no pattern matched')}
+    for pattern in rule.patterns:
+        for exception in [pattern] + pattern.unless:
+            exits[exception] = find('"%s"' % exception.src)
+    return exits
+
+
+def escape_label(value):
+    """Escape a Prometheus label value"""
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class ProfilingCorrectionManager(CorrectionManager):
+
+    """This manager counts and times what the rules and the stages do.
+
+    The rules are wrapped in the dispatch tables of this manager only, so
+    CorrectionManager itself runs without any instrumentation. With exits,
+    the line where each rule returned without a match is also recorded,
+    through sys.setprofile for the hand-written rules, which makes the rules
+    about twice as slow: it is off by default. The rules compiled from patterns (see
+    grammar.Patterns) exit at the line of the exception that stopped them
+    instead. The results of load_texts generate their corrections
+    themselves, outside of the stages.
+    """
+
+    def __init__(self, exits=False, **kwargs):
+        self.exits = exits
+        self.matches = 0  # calls to matched
+        self.reset_counters()
+        # the same wrappers for every pass
+        wrappers = dict((rule.do, self.instrument(rule.do))
+                        for rule in Corrections.RULES)
+        self.dispatch = dict(
+            (passes, dict((keyword, tuple(wrappers[rule] for rule in rules))
+                          for keyword, rules in dispatch.items()))
+            for passes, dispatch in Corrections.DISPATCH.items())
+        super(ProfilingCorrectionManager, self).__init__(**kwargs)
+
+    def reset_counters(self):
+        """Reset the counters of every rule and every stage"""
+        self.rules = dict((rule_name(rule.do), {
+            'invocations': 0,
+            'matches': 0,
+            'seconds': 0.0,
+            'exits': {},  # line -> count
+        }) for rule in Corrections.RULES)
+        self.reasons = {}  # (rule, line) -> source
+        self.stages = dict((stage, {'calls': 0, 'seconds': 0.0})
+                           for stage in STAGES)
+
+    def instrument(self, rule):
+        """Wrap a rule to count its invocations, matches and exits"""
+        name = rule_name(rule)
+        code = rule.__code__
+        explain = getattr(rule, 'explain', None)
+        exits = pattern_exits(rule) if explain is not None else None
+
+        def profiled(manager, cur):
+            stats = manager.rules[name]
+            stats['invocations'] += 1
+            matches = manager.matches
+            if manager.exits and explain is None:
+                lines = []
+
+                def profile(frame, event, arg):
+                    if event == 'return' and frame.f_code is code:
+                        lines.append(frame.f_lineno)
+                previous = sys.getprofile()
+                sys.setprofile(profile)
+                start = timer()
+                try:
+                    rule(manager, cur)
+                finally:
+                    stats['seconds'] += timer() - start
+                    sys.setprofile(previous)
+            else:
+                lines = None
+                start = timer()
+                try:
+                    rule(manager, cur)
+                finally:
+                    stats['seconds'] += timer() - start
+            if manager.matches != matches:
+                stats['matches'] += 1
+            elif manager.exits and explain is not None:
+                line, reason = exits[explain(manager, cur)]
+                stats['exits'][line] = stats['exits'].get(line, 0) + 1
+                manager.reasons[name, line] = reason
+            elif lines:
+                line = lines[-1]
+                stats['exits'][line] = stats['exits'].get(line, 0) + 1
+                if (name, line) not in manager.reasons:
+                    manager.reasons[name, line] = exit_reason(code, line)
+        profiled.__name__ = name
+        return profiled
+
+    def timed(self, stage, function, *args):
+        """Call a function and add its time to a stage"""
+        stats = self.stages[stage]
+        start = timer()
+        try:
+            return function(*args)
+        finally:
+            stats['calls'] += 1
+            stats['seconds'] += timer() - start
+
+    def compile_transform(self, **options):
+        """Return the function that performs the transformations, timed"""
+        transform_ = CorrectionManager.compile_transform(**options)
+        return lambda text: self.timed('transform', transform_, text)
+
+    def partition(self, text):
+        return self.timed('partitionize',
+                          super(ProfilingCorrectionManager, self).partition, text)
+
+    def do_checks_all(self):
+        return self.timed('do_checks_all',
+                          super(ProfilingCorrectionManager, self).do_checks_all)
+
+    def generate_details(self):
+        return self.timed('generate_details',
+                          super(ProfilingCorrectionManager, self).generate_details)
+
+    def generate_texts(self):
+        return self.timed('generate_texts',
+                          super(ProfilingCorrectionManager, self).generate_texts)
+
+    def matched(self, kind):
+        self.matches += 1
+        return super(ProfilingCorrectionManager, self).matched(kind)
+
+    def get_counters(self):
+        """Return the counters as a dict of JSON types"""
+        rules = {}
+        for name, stats in self.rules.items():
+            rules[name] = {
+                'invocations': stats['invocations'],
+                'matches': stats['matches'],
+                'seconds': stats['seconds'],
+                'exits': dict((str(line), {
+                    'count': count,
+                    'reason': self.reasons[name, line],
+                }) for line, count in stats['exits'].items()),
+            }
+        stages = dict((stage, dict(stats)) for stage, stats in self.stages.items())
+        return {'rules': rules, 'stages': stages}
+
+    def get_prometheus(self, prefix='grammar'):
+        """Return the counters in the Prometheus text exposition format"""
+        lines = []
+
+        def metric(name, help_text, samples):
+            lines.append('# HELP %s_%s %s' % (prefix, name, help_text))
+            lines.append('# TYPE %s_%s counter' % (prefix, name))
+            for labels, value in samples:
+                lines.append('%s_%s{%s} %s' % (prefix, name, ','.join(
+                    '%s="%s"' % (label, escape_label(text)) for label, text in labels), repr(value)))
+        rules = sorted(self.rules.items())
+        metric('rule_invocations_total', 'Rules run because of their keywords.',
+               [((('rule', name),), stats['invocations']) for name, stats in rules])
+        metric('rule_matches_total', 'Rules that found an error.',
+               [((('rule', name),), stats['matches']) for name, stats in rules])
+        metric('rule_exits_total', 'Rules that returned without an error, by line.',
+               [((('rule', name), ('line', str(line)), ('reason', self.reasons[name, line])), count)
+                for name, stats in rules for line, count in sorted(stats['exits'].items())])
+        metric('rule_seconds_total', 'Time spent in the rules.',
+               [((('rule', name),), stats['seconds']) for name, stats in rules])
+        stages = [(stage, self.stages[stage]) for stage in STAGES]
+        metric('stage_calls_total', 'Runs of the stages of the pipeline.',
+               [((('stage', stage),), stats['calls']) for stage, stats in stages])
+        metric('stage_seconds_total', 'Time spent in the stages of the pipeline.',
+               [((('stage', stage),), stats['seconds']) for stage, stats in stages])
+        return '\n'.join(lines) + '\n'
@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+
+"""Streaming interface for line-delimited input: grammar.stream, python -m grammar"""
+
+import argparse
+import io
+from itertools import tee
+import json
+import sys
+
+from .Corrector import CorrectionManager
+from .Units import load_lexicon
+
+try:
+    from itertools import izip as zip
+except ImportError:  # pragma: no cover
+    pass
+
+# Options of transform, with their command-line flags
+OPTIONS = (
+    ('do_decode_html', '--decode-html'),
+    ('do_ellipsis', '--ellipsis'),
+    ('do_quotations', '--quotations'),
+    ('do_askfm', '--askfm'),
+    ('do_fixcaps', '--fixcaps'),
+    ('do_fixi', '--fixi'),
+    ('do_fixnewline', '--fixnewline'),
+)
+
+
+def read_records(lines, text_key='text', input_format='auto'):
+    """Yield (record, text) for each line, which is a JSON object or plain text
+
+    With input_format='auto', lines starting with '{' are read as JSON if
+    possible. JSON records without a string at text_key are skipped.
+    """
+    for line in lines:
+        line = line.rstrip('\r\n')
+        if input_format != 'text' and (input_format == 'json' or line.startswith('{')):
+            try:
+                record = json.loads(line)
+            except ValueError:
+                if input_format == 'json':
+                    raise
+            else:
+                if isinstance(record, dict):
+                    text = record.get(text_key)
+                    if isinstance(text, type(u'')):
+                        yield record, text
+                continue
+        if line:
+            yield line, line
+
+
+def stream(lines, text_key='text', input_format='auto', **options):
+    """Yield (record, CorrectionResult) for each record with detections
+
+    The lines are read lazily, one at a time, so any number of them can be
+    checked with the same memory.
+    """
+    parser = CorrectionManager()
+    records, copies = tee(read_records(lines, text_key, input_format))
+    texts = (text for record, text in copies)
+    for (record, text), result in zip(records, parser.load_texts(texts, **options)):
+        if result:
+            yield record, result
+
+
+def format_result(record, result):
+    """Return a JSON line (text) for a record with detections"""
+    if isinstance(record, dict):
+        output = dict(record)
+    else:
+        output = {'text': record}
+    output['corrections'] = result.corrections
+    output['corrected'] = sorted(result.corrected)
+    output['details'] = [correction.as_dict() for correction in result.details]
+    line = json.dumps(output, sort_keys=True)
+    if not isinstance(line, type(u'')):  # Python 2
+        line = line.decode('ascii')
+    return line
+
+
+def main(argv=None, stdin=None, stdout=None):
+    """Command-line interface: print a JSON line for each record with detections"""
+    arguments = argparse.ArgumentParser(
+        prog='python -m grammar',
+        description='Detect grammar errors in JSONL or plain-text lines.')
+    arguments.add_argument('files', nargs='*', metavar='FILE',
+                           help='input files (default: standard input)')
+    arguments.add_argument('--key', default='text',
+                           help='key of the text in JSON records (default: text)')
+    arguments.add_argument('--format', choices=('auto', 'json', 'text'),
+                           default='auto', help='input format (default: auto)')
+    arguments.add_argument('--lexicon', metavar='FILE',
+                           help='lexicon file of word classes to load')
+    for option, flag in OPTIONS:
+        arguments.add_argument(flag, dest=option, action='store_true')
+    arguments = arguments.parse_args(argv)
+    if arguments.lexicon:
+        load_lexicon(arguments.lexicon)
+    stdout = stdout or sys.stdout
+    options = dict((option, getattr(arguments, option))
+                   for option, flag in OPTIONS)
+
+    if stdin is None and not arguments.files:
+        # UTF-8 text, rather than bytes on Python 2
+        stdin = io.open(sys.stdin.fileno(), encoding='utf-8', closefd=False)
+
+    def lines():
+        if not arguments.files:
+            for line in stdin:
+                if not isinstance(line, type(u'')):
+                    line = line.decode('utf-8')
+                yield line
+        for name in arguments.files:
+            with io.open(name, encoding='utf-8') as f:
+                for line in f:
+                    yield line
+    for record, result in stream(lines(), arguments.key, arguments.format, **options):
+        stdout.write(format_result(record, result) + u'\n')
+        stdout.flush()
@@ -3,14 +3,59 @@
 
 """Functions for the parser, mainly to transform the string"""
 
+import re
+
 from .Units import Space
 from .Units import Word
 
 SPACECHARS = r' ,;:()[]{}.!?'  # no '-' dashes; they form compound words
+REGEX_SPACES = re.compile(u'([%s]+)' % re.escape(SPACECHARS))
+
+
+def split_blocks(text):
+    """Return the text of each Word and Space for a given string."""
+    # [word, space, word, ..., word], where only the first and last words can
+    # be empty (at the start and at the end of the text)
+    blocks = REGEX_SPACES.split(text)
+    if len(blocks) > 1 and not blocks[-1]:
+        blocks.pop()  # the last space ends the text
+    else:
+        blocks.append('')  # the last word ends the text
+    return blocks
 
 
 def partitionize(text):
     """Yield a list consisting of [Word, Space] * N for a given string."""
+    blocks = split_blocks(text)
+    units = []
+    start = 0
+    for i, block in enumerate(blocks):
+        units.append(Space(block, start) if i & 1 else Word(block, start))
+        start += len(block)
+    return units
+
+
+def partitionize_into(text, units):
+    """Like partitionize, but reinitialising the units of a list in place
+
+    The list only grows when the text has more units than any text before.
+    Returns the number of units of the text, at the start of the list.
+    """
+    blocks = split_blocks(text)
+    reused = min(len(blocks), len(units))
+    start = 0
+    for i in range(reused):
+        units[i].__init__(blocks[i], start)
+        start += len(blocks[i])
+    for i in range(reused, len(blocks)):
+        block = blocks[i]
+        units.append(Space(block, start) if i & 1 else Word(block, start))
+        start += len(block)
+    return len(blocks)
+
+
+def partitionize_chars(text):
+    """Like partitionize, but walking the text character by character"""
     def partitionize_(text):
         word_start = 0
         space_start = None
@@ -27,13 +72,24 @@ def partitionize(text):
                     space_start = i
                 if space_start is not None:
                     # start of new word -- process last block first
-                    yield Word(text[word_start:space_start])
-                    yield Space(text[space_start:i])
+                    yield Word(text[word_start:space_start], word_start)
+                    yield Space(text[space_start:i], space_start)
                     word_start = i
                     space_start = None
     return list(partitionize_(text))
 
-import re
+
+def compile_keywords(keywords):
+    """Compile a regex that finds any of the keywords as a whole word.
+
+    Words are delimited like in partitionize and compared case-insensitively,
+    so a text without a match cannot contain any of the keywords."""
+    space = re.escape(SPACECHARS)
+    return re.compile(u'(?<![^%s])(?:%s)(?![^%s])' % (
+        space,
+        '|'.join(map(re.escape, sorted(keywords, key=len, reverse=True))),
+        space), re.IGNORECASE)
+
 
 # Capture any two words within the smallest possible quotation marks
 REGEX_QUOTATION = re.compile(u'["“].+? .+?["”]', re.DOTALL)
@@ -57,8 +113,31 @@ def REGEX_FIXI_REPL(mo):
     return "I" + mo.group(1)  # lambda mo: "I" + mo.group(1).lower(),
 # "[I]%s", word must follow if %s is empty
 # DO NOT USE re.I or the expression will waste time
-REGEX_FIXI = re.compile(
-    r"(?:(?<=^)|(?<=[ ,;.]))i(|'(?:[dD]|[lL][lL])(?:'[vV][eE])?|'[mM]|'[vV][eE])(?=$|[ ,;.])")
+REGEX_FIXI_PATTERN = r"(?:(?<=^)|(?<=[ ,;.]))i(|'(?:[dD]|[lL][lL])(?:'[vV][eE])?|'[mM]|'[vV][eE])(?=%s[ ,;.])"
+REGEX_FIXI = re.compile(REGEX_FIXI_PATTERN % '$|')
+# For a sentence of REGEX_FIX_ALLCAPS followed by '.' or by [!?"]
+REGEX_FIXI_PERIOD = re.compile(REGEX_FIXI_PATTERN % r'\Z|')
+REGEX_FIXI_CLOSED = re.compile(REGEX_FIXI_PATTERN % '')
+
+
+def REGEX_FIX_ALLCAPS_FIXI_REPL(mo):
+    """Capitalize a sentence and fix its i* -> I* like REGEX_FIXI would
+
+    Only the first letter of a sentence can follow something outside of it,
+    and that letter is capitalized anyway, but the end of the sentence
+    depends on the character after it.
+    """
+    sentence = mo.group(0).capitalize()
+    if 'i' in sentence:
+        after = mo.string[mo.end():mo.end() + 1]
+        if not after:
+            regex = REGEX_FIXI
+        elif after == '.':
+            regex = REGEX_FIXI_PERIOD
+        else:
+            regex = REGEX_FIXI_CLOSED
+        sentence = regex.sub(REGEX_FIXI_REPL, sentence)
+    return sentence
 
 
 def REGEX_FIXNL_REPL(mo):
@@ -66,49 +145,309 @@ def REGEX_FIXNL_REPL(mo):
 REGEX_FIXNL = re.compile(r" *[\r\n]+ *")
 
 
-def transform(text, do_decode_html=False, do_ellipsis=False, do_quotations=False, do_askfm=False, do_fixcaps=False, do_fixi=False, do_fixnewline=False, **kwargs):
-    """Perform transformations on some text"""
-    # Decode &[...]; -> [char]
+try:
+    _unichr = unichr
+except NameError:  # Python 3
+    _unichr = chr
+
+try:
+    from html.entities import html5
+    HTML_ENTITIES = dict((name[:-1], char)
+                         for name, char in html5.items() if name.endswith(';'))
+except ImportError:  # pragma: no cover
+    from htmlentitydefs import name2codepoint
+    HTML_ENTITIES = dict((name, _unichr(codepoint))
+                         for name, codepoint in name2codepoint.items())
+    HTML_ENTITIES['apos'] = "'"
+
+# &name; &#decimal; or &#xhex;
+REGEX_HTML = re.compile(
+    r'&(?:([A-Za-z][A-Za-z0-9]*)|#([0-9]{1,7})|#[xX]([0-9A-Fa-f]{1,6}));')
+
+
+def REGEX_HTML_REPL(mo):
+    if mo.group(1):
+        return HTML_ENTITIES.get(mo.group(1), mo.group(0))
+    if mo.group(2):
+        codepoint = int(mo.group(2))
+    else:
+        codepoint = int(mo.group(3), 16)
+    if 0x80 <= codepoint <= 0x9F:
+        # Windows-1252 characters, as browsers decode them
+        try:
+            return bytearray([codepoint]).decode('cp1252')
+        except UnicodeDecodeError:
+            return mo.group(0)
+    if codepoint == 0 or 0xD800 <= codepoint <= 0xDFFF or codepoint > 0x10FFFF:
+        return mo.group(0)
+    try:
+        return _unichr(codepoint)
+    except ValueError:  # pragma: no cover
+        return mo.group(0)  # narrow build of Python 2
+
+
+ELLIPSIS = (('...', u'…'),)
+
+
+def decode_html(text):
+    """Decode &[...]; -> [char] (named, decimal and hexadecimal)"""
+    if '&' not in text:
+        return text
+    return REGEX_HTML.sub(REGEX_HTML_REPL, text)
+
+
+def compress_ellipsis(text):
+    """Compress "..." -> '…'"""
+    return text.replace('...', u'…')
+
+
+def remove_quotations(text):
+    """Remove quotations"""
+    if '"' not in text and u'“' not in text:
+        return text
+    return REGEX_QUOTATION.sub(REGEX_QUOTATION_REPL, text)
+
+
+def remove_askfm(text):
+    """Remove ask.fm question quotations"""
+    if u'—' not in text:
+        return text
+    return REGEX_QUOTATION_ASKFM.sub(REGEX_QUOTATION_ASKFM_REPL, text)
+
+
+def is_shouting(text):
+    """Detect content entirely written in ALLCAPS or in Title Case Text
+
+    The words are counted in a single pass, which stops as soon as the
+    outcome cannot change anymore. The thresholds are divided as they always
+    were, so Python 2 rounds them down.
+    """
+    words = text.split()
+    words_left = len(words)
+    words_total = 0
+    words_upper = 0
+    words_title = 0
+    for word in words:
+        words_left -= 1
+        # people tend to use auto-@reply, which leaves
+        # @<lowercase_name>, and C&P'd links
+        if word[0] == '@' or word.startswith(('http://', 'https://')):
+            continue
+        words_total += 1
+        if word.isupper():
+            words_upper += 1
+            if word.istitle():
+                words_title += 1
+            # 65% all-caps, even if no other word is
+            if words_upper >= (words_total + words_left) * 13 / 20:
+                return True
+        elif word.istitle():
+            words_title += 1
+            # 80% title-case, even if no other word is
+            if words_title >= (words_total + words_left) * 4 / 5:
+                return True
+        # neither, even if every other word is
+        elif (words_upper + words_left < (words_total + words_left) * 13 / 20 and
+                words_title + words_left < (words_total + words_left) * 4 / 5):
+            return False
+    # 65% all-caps or 80% title-case
+    return words_upper >= words_total * 13 / 20 or words_title >= words_total * 4 / 5
+
+
+def fix_caps(text, do_fixi=True):
+    """Only capitalize the first letter of every sentence of shouted text
+
+    With do_fixi, i* -> I* is fixed in the same pass.
+    """
+    if is_shouting(text):
+        if do_fixi:
+            return REGEX_FIX_ALLCAPS.sub(REGEX_FIX_ALLCAPS_FIXI_REPL, text)
+        return REGEX_FIX_ALLCAPS.sub(REGEX_FIX_ALLCAPS_REPL, text)
+    return text
+
+
+def fix_i(text):
+    """Fix i* -> I*"""
+    return REGEX_FIXI.sub(REGEX_FIXI_REPL, text)
+
+
+def fix_caps_and_i(text):
+    """Fix the caps of shouted text and i* -> I*, in a single pass"""
+    if is_shouting(text):
+        return REGEX_FIX_ALLCAPS.sub(REGEX_FIX_ALLCAPS_FIXI_REPL, text)
+    return REGEX_FIXI.sub(REGEX_FIXI_REPL, text)
+
+
+def fix_newline(text):
+    """Fix new-lines"""
+    return REGEX_FIXNL.sub(REGEX_FIXNL_REPL, text)
+
+
+def compile_replacements(triggers, replacements, do_fixnewline=False):
+    """Return a function doing literal replacements (and fixing new-lines) in one pass
+
+    The text is not even scanned unless it contains one of the triggers. The
+    replacements must not create anything that another one would replace.
+    """
+    replacements = dict(replacements)
+    alternatives = [re.escape(old)
+                    for old in sorted(replacements, key=len, reverse=True)]
+    if do_fixnewline:
+        triggers = tuple(triggers) + ('\r', '\n')
+        alternatives.append(REGEX_FIXNL.pattern)
+    regex = re.compile(u'|'.join(alternatives))
+
+    def repl(mo):
+        new = replacements.get(mo.group(0))
+        if new is None:
+            return REGEX_FIXNL_REPL(mo)
+        return new
+
+    def replace(text):
+        for trigger in triggers:
+            if trigger in text:
+                return regex.sub(repl, text)
+        return text
+    return replace
+
+
+# Functions returned by compile_transform, for each combination of options
+TRANSFORM_CACHE = {}
+
+
+def compile_transform(do_decode_html=False, do_ellipsis=False, do_quotations=False, do_askfm=False, do_fixcaps=False, do_fixi=False, do_fixnewline=False, **kwargs):
+    """Return a function that performs the selected transformations on some text
+
+    The function is only built once for each combination of options. Steps
+    that cannot affect each other are fused into a single pass.
+    """
+    key = (bool(do_decode_html), bool(do_ellipsis), bool(do_quotations),
+           bool(do_askfm), bool(do_fixcaps), bool(do_fixi), bool(do_fixnewline))
+    try:
+        return TRANSFORM_CACHE[key]
+    except KeyError:
+        pass
+    steps = []
     if do_decode_html:
-        text = text.replace('&#39;', "'")
-        text = text.replace('&quot;', '"')
-        text = text.replace('&gt;', '>')
-        text = text.replace('&lt;', '<')
-        text = text.replace('&amp;', '&')
-    # Compress "..." -> '…'
+        steps.append(decode_html)
+    # Compress "..." -> '…' (and fix new-lines, if nothing in between depends
+    # on them)
+    triggers = []
+    replacements = []
     if do_ellipsis:
-        text = text.replace('...', u'…')
-    # Remove quotations
+        triggers.append('...')
+        replacements.extend(ELLIPSIS)
+    if do_fixnewline and not (do_quotations or do_askfm or do_fixcaps or do_fixi):
+        steps.append(compile_replacements(triggers, replacements, True))
+        do_fixnewline = False
+    elif replacements:
+        steps.append(compile_replacements(triggers, replacements))
     if do_quotations:
-        text = REGEX_QUOTATION.sub(REGEX_QUOTATION_REPL, text)
-    # Remove ask.fm question quotations
+        steps.append(remove_quotations)
     if do_askfm:
-        text = REGEX_QUOTATION_ASKFM.sub(REGEX_QUOTATION_ASKFM_REPL, text)
-    # Detect content entirely written in ALLCAPS or in Title Case Text
-    if do_fixcaps:
-        words_total = 0
-        words_upper = 0
-        words_title = 0
-        for word in text.split():
-            if word:
-                # people tend to use auto-@reply, which leaves
-                # @<lowercase_name>, and C&P'd links
-                if word[0] == '@' or word.startswith('http://') or word.startswith('https://'):
-                    continue
-                words_total += 1
-                if word.isupper():
-                    words_upper += 1
-                if word.istitle():
-                    words_title += 1
-        # 65% all-caps or 80% title-case
-        if words_upper >= words_total * 13 / 20 or words_title >= words_total * 4 / 5:
-            # Now, only the first letter of every sentence is now capitalized.
-            text = REGEX_FIX_ALLCAPS.sub(REGEX_FIX_ALLCAPS_REPL, text)
-            do_fixi = True
-    # Fix i* -> I*
+        steps.append(remove_askfm)
+    if do_fixcaps and do_fixi:
+        steps.append(fix_caps_and_i)
+    elif do_fixcaps:
+        # fixing the caps also fixes i* -> I*
+        steps.append(fix_caps)
+    elif do_fixi:
+        steps.append(fix_i)
+    if do_fixnewline:
+        steps.append(fix_newline)
+
+    def transform_(text):
+        for step in steps:
+            text = step(text)
+        return text
+    TRANSFORM_CACHE[key] = transform_
+    return transform_
+
+
+def transform(text, **options):
+    """Perform transformations on some text"""
+    return compile_transform(**options)(text)
+
+
+class OffsetMap(object):
+
+    """The span in the original text of each character of a transformed text"""
+
+    def __init__(self, text):
+        """Map some text to itself"""
+        self.length = len(text)
+        self.starts = list(range(len(text)))
+        self.ends = list(range(1, len(text) + 1))
+
+    def sub(self, regex, repl, text):
+        """Return regex.sub(repl, text), mapping the new characters as well
+
+        Replacements of the same length and replacements by the first group
+        are mapped character by character, and other ones to the whole match.
+        """
+        pieces = []
+        starts = []
+        ends = []
+        last = 0
+        for mo in regex.finditer(text):
+            start, end = mo.span()
+            new = repl(mo) if callable(repl) else repl
+            pieces.append(text[last:start])
+            pieces.append(new)
+            starts.extend(self.starts[last:start])
+            ends.extend(self.ends[last:start])
+            if len(new) == end - start:
+                starts.extend(self.starts[start:end])
+                ends.extend(self.ends[start:end])
+            elif regex.groups and new == mo.group(1):
+                starts.extend(self.starts[mo.start(1):mo.end(1)])
+                ends.extend(self.ends[mo.start(1):mo.end(1)])
+            else:
+                span = self.span(start, end)
+                starts.extend([span[0]] * len(new))
+                ends.extend([span[1]] * len(new))
+            last = end
+        if not pieces:
+            return text
+        pieces.append(text[last:])
+        starts.extend(self.starts[last:])
+        ends.extend(self.ends[last:])
+        self.starts = starts
+        self.ends = ends
+        return u''.join(pieces)
+
+    def span(self, start, end):
+        """Return the span in the original text of text[start:end]"""
+        if start < end:
+            return self.starts[start], self.ends[end - 1]
+        if start < len(self.starts):
+            return self.starts[start], self.starts[start]
+        return self.length, self.length
+
+
+REGEX_ELLIPSIS = re.compile(re.escape(ELLIPSIS[0][0]))
+
+
+def transform_offsets(text, do_decode_html=False, do_ellipsis=False, do_quotations=False, do_askfm=False, do_fixcaps=False, do_fixi=False, do_fixnewline=False, **kwargs):
+    """Perform transformations on some text, and return it with an OffsetMap
+
+    This applies every step in turn, so it is slower than transform, which
+    returns the same text.
+    """
+    offsets = OffsetMap(text)
+    if do_decode_html and '&' in text:
+        text = offsets.sub(REGEX_HTML, REGEX_HTML_REPL, text)
+    if do_ellipsis:
+        text = offsets.sub(REGEX_ELLIPSIS, ELLIPSIS[0][1], text)
+    if do_quotations and ('"' in text or u'“' in text):
+        text = offsets.sub(REGEX_QUOTATION, REGEX_QUOTATION_REPL, text)
+    if do_askfm and u'—' in text:
+        text = offsets.sub(REGEX_QUOTATION_ASKFM, REGEX_QUOTATION_ASKFM_REPL, text)
+    if do_fixcaps and is_shouting(text):
+        text = offsets.sub(REGEX_FIX_ALLCAPS, REGEX_FIX_ALLCAPS_REPL, text)
+        do_fixi = True
     if do_fixi:
-        text = REGEX_FIXI.sub(REGEX_FIXI_REPL, text)
-    # fix new-lines
+        text = offsets.sub(REGEX_FIXI, REGEX_FIXI_REPL, text)
     if do_fixnewline:
-        text = REGEX_FIXNL.sub(REGEX_FIXNL_REPL, text)
-    return text
+        text = offsets.sub(REGEX_FIXNL, REGEX_FIXNL_REPL, text)
+    return text, offsets
@@ -1,7 +1,18 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
-"""Sets for the parser"""
+"""Units of the parser, and the lexicon of the classes of their words"""
+
+import hashlib
+import io
+import json
+import sys
+
+try:
+    intern = sys.intern
+except AttributeError:  # pragma: no cover
+    def intern(s):  # Python 2 can only intern byte strings
+        return s
 
 
 class Sets:
@@ -227,13 +238,238 @@ class Sets:
         'very',  # adjective, adverb?
     ])
 
+    # words that are not included as "near" words
+    SET_NOT_NEAR = set(['', '/', u"…"])
+
+
+# Version of the format of the lexicon files
+LEXICON_FORMAT = 1
+
+
+class Lexicon(object):
+
+    """Classes of words, as a mask of bits for each lowercase word, and maps of words
+
+    The masks are given to each Word when it is created, so the classes have
+    to be changed before the texts are partitioned. The bits of the classes
+    never change, and the dicts of masks and maps are only changed in place.
+    A derived class (see derive) is computed again whenever its parts change.
+    """
+
+    def __init__(self):
+        self.bits = {}  # class -> bit
+        self.masks = {}  # word -> mask of its classes
+        self.maps = {}  # name -> dict of words, such as inflections
+        self.derived = {}  # class -> (classes it is made of, its own words)
+        self.derivations = []  # derived classes, parts first
+        self.version = None  # of the last file loaded
+        self.generation = 0  # number of changes
+        self.digest = None  # (generation, digest)
+
+    def add(self, name, words):
+        """Add some words to a class (which is created if needed) and return its bit"""
+        words = [intern(word.lower()) for word in words]
+        if name in self.derived:
+            self.derived[name][1].update(words)
+        bit = self.add_words(name, words)
+        self.update_derived(name)
+        return bit
+
+    def add_words(self, name, words):
+        """Add some lowercase words to a class, without its derived classes"""
+        bit = self.bits.get(name)
+        if bit is None:
+            bit = self.bits[name] = 1 << len(self.bits)
+        masks = self.masks
+        for word in words:
+            masks[word] = masks.get(word, 0) | bit
+        self.generation += 1
+        return bit
+
+    def set_class(self, name, words):
+        """Replace the words of a class and return its bit
+
+        The words of a derived class are those of its parts, and the words
+        given here which are in none of them.
+        """
+        words = set(intern(word.lower()) for word in words)
+        if name in self.derived:
+            parts = self.derived[name][0]
+            self.derived[name] = parts, words - self.get_union(parts)
+            return self.compute(name)
+        bit = self.replace_words(name, words)
+        self.update_derived(name)
+        return bit
+
+    def replace_words(self, name, words):
+        """Replace the words of a class, without its derived classes"""
+        bit = self.bits.get(name)
+        if bit is not None:
+            masks = self.masks
+            for word in [word for word, mask in masks.items() if mask & bit]:
+                masks[word] &= ~bit
+                if not masks[word]:
+                    del masks[word]
+        return self.add_words(name, words)
+
+    def derive(self, name, parts, words=()):
+        """Make a class of the words of other classes and some words, and return its bit"""
+        parts = tuple(parts)
+        words = set(intern(word.lower()) for word in words)
+        self.derived[name] = parts, words - self.get_union(parts)
+        if name not in self.derivations:
+            self.derivations.append(name)
+        return self.compute(name)
+
+    def compute(self, name):
+        """Compute the words of a derived class again, and return its bit"""
+        parts, words = self.derived[name]
+        bit = self.replace_words(name, words | self.get_union(parts))
+        self.update_derived(name)
+        return bit
+
+    def update_derived(self, name):
+        """Compute the classes derived from a class again"""
+        for derived in self.derivations:
+            if name in self.derived[derived][0]:
+                self.compute(derived)
+
+    def get_union(self, names):
+        """Return the set of the words of some classes"""
+        mask = 0
+        for name in names:
+            mask |= self.bits[name]
+        return set(word for word, word_mask in self.masks.items() if word_mask & mask)
+
+    def add_map(self, name, mapping):
+        """Add some words to a map (which is created if needed) and return the map"""
+        words = self.maps.setdefault(name, {})
+        words.update(mapping)
+        self.generation += 1
+        return words
+
+    def set_map(self, name, mapping):
+        """Replace the words of a map and return the map"""
+        self.maps.setdefault(name, {}).clear()
+        return self.add_map(name, mapping)
+
+    def get_bit(self, name):
+        """Return the bit of a class"""
+        return self.bits[name]
+
+    def get_words(self, name):
+        """Return the set of words of a class"""
+        bit = self.bits[name]
+        return set(word for word, mask in self.masks.items() if mask & bit)
+
+    def get_map(self, name):
+        """Return a map of words"""
+        return self.maps[name]
+
+    def get_classes(self):
+        """Return a dict of the sets of words of each class"""
+        classes = dict((name, set()) for name in self.bits)
+        for word, mask in self.masks.items():
+            for name, bit in self.bits.items():
+                if mask & bit:
+                    classes[name].add(word)
+        return classes
+
+    def get_digest(self):
+        """Return a hash of the classes and the maps, which changes with any of them"""
+        if self.digest is None or self.digest[0] != self.generation:
+            data = json.dumps([sorted((name, sorted(words)) for name, words in self.get_classes().items()),
+                               sorted((name, sorted(words.items())) for name, words in self.maps.items())])
+            self.digest = self.generation, hashlib.sha1(data.encode('utf-8')).hexdigest()
+        return self.digest[1]
+
+    def load(self, data):
+        """Replace the classes and the maps of a lexicon file, parsed as a dict
+
+        The classes and the maps that are not in the file are kept. The
+        derived classes in the file are replaced after their parts.
+        """
+        if data.get('format') != LEXICON_FORMAT:
+            raise ValueError('unsupported lexicon format: %r' % data.get('format'))
+        classes = data.get('classes', {})
+        for name, words in sorted(classes.items()):
+            if name not in self.derived:
+                self.replace_words(name, [intern(word.lower()) for word in words])
+        # each derived class once, after its parts
+        for name in self.derivations:
+            parts, words = self.derived[name]
+            if name in classes:
+                words = set(intern(word.lower()) for word in classes[name]) - self.get_union(parts)
+                self.derived[name] = parts, words
+            self.replace_words(name, words | self.get_union(parts))
+        for name, mapping in sorted(data.get('maps', {}).items()):
+            self.set_map(name, mapping)
+        self.version = data.get('version')
+
+    def dump(self, version=None):
+        """Return the lexicon as the text of a lexicon file (JSON, with a line for each class or map)
+
+        A derived class only has its own words, so that it still follows
+        its parts when the file is edited and loaded.
+        """
+        classes = self.get_classes()
+        for name in self.derived:
+            classes[name] = self.derived[name][1]
+        classes = sorted(classes.items())
+        maps = sorted(self.maps.items())
+        return u'{\n"format": %d,\n"version": %s,\n"classes": {\n%s\n},\n"maps": {\n%s\n}\n}\n' % (
+            LEXICON_FORMAT, json.dumps(version if version is not None else self.version),
+            u',\n'.join(u'%s: %s' % (json.dumps(name), json.dumps(sorted(words)))
+                        for name, words in classes),
+            u',\n'.join(u'%s: %s' % (json.dumps(name), json.dumps(mapping, sort_keys=True))
+                        for name, mapping in maps))
+
+
+def load_lexicon(path, lexicon=None):
+    """Load a lexicon file into a lexicon (default: LEXICON) and return it"""
+    if lexicon is None:
+        lexicon = LEXICON
+    with io.open(path, encoding='utf-8') as f:
+        lexicon.load(json.load(f))
+    return lexicon
+
+
+def dump_lexicon(path, lexicon=None, version=None):
+    """Write a lexicon (default: LEXICON) to a lexicon file"""
+    if lexicon is None:
+        lexicon = LEXICON
+    with io.open(path, 'w', encoding='utf-8') as f:
+        f.write(lexicon.dump(version))
+
+
+LEXICON = Lexicon()
+MASKS = LEXICON.masks
+
+ARTICLE = LEXICON.add('article', Sets.SET_ARTICLE)
+CONJUNCTION_COORDINATING = LEXICON.add('conjunction_coordinating', Sets.SET_CONJUNCTION_COORDINATING)
+POSSESSIVE_DETERMINER = LEXICON.add('possessive_determiner', Sets.SET_DETERMINER_POSSESSIVE)
+POSSESSIVE_PRONOUN = LEXICON.add('possessive_pronoun', Sets.SET_PRONOUN_POSSESSIVE)
+PREPOSITION = LEXICON.add('preposition', Sets.SET_PREPOSITION_SHORT)
+PRONOUN_PERSONAL = LEXICON.add('pronoun_personal', Sets.SET_PRONOUN_PERSONAL)
+# unions of the classes above, as in Sets
+DETERMINER = LEXICON.derive('determiner', ['article', 'possessive_determiner'],
+                            Sets.SET_DETERMINER)
+POSSESSIVE = LEXICON.derive('possessive', ['possessive_determiner', 'possessive_pronoun'])
+COMMON = LEXICON.derive('common', ['determiner', 'preposition', 'conjunction_coordinating',
+                                   'pronoun_personal'], Sets.SET_COMMON)
+NOT_NEAR = LEXICON.add('not_near', Sets.SET_NOT_NEAR)
+
 # The "building blocks" of sequences!
 
 
 class SequenceUnit(object):
 
-    def __init__(self, original):
+    # there are many units, so avoid a __dict__ for each of them
+    __slots__ = ('original', 'flags', 'new_text', 'start')
+
+    def __init__(self, original, start=0):
         self.original = original
+        self.start = start  # offset in the (transformed) text
         # Word flags:
         # -1 = hidden, 0 = verbatim, 1 = modified
         # 2 = common word (from correction)
@@ -244,6 +480,10 @@ class SequenceUnit(object):
         self.flags = 1
         self.new_text = new_text
 
+    def get_end(self):
+        """Return the offset after this unit in the (transformed) text"""
+        return self.start + len(self.original)
+
     def get_final(self):
         if self.new_text is not None:  # and self.flags == 1
             return self.new_text
@@ -255,22 +495,29 @@ class SequenceUnit(object):
 
 class Space(SequenceUnit):  # word separators - can also have punctuation
 
-    def __init__(self, spacer):
+    __slots__ = ('sentenceBreaker', 'anyBreaker')
+
+    SENTENCE_BREAKERS = frozenset('.!?')
+    ANY_BREAKERS = frozenset(',;:()[]{}')
+
+    def __init__(self, spacer, start=0):
         # (space) does not break
-        self.sentenceBreaker = ('.' in spacer) or (
-            '!' in spacer) or ('?' in spacer)
-        self.anyBreaker = self.sentenceBreaker or (',' in spacer) or (';' in spacer) or (':' in spacer) or (
-            '(' in spacer) or (')' in spacer) or ('[' in spacer) or (']' in spacer) or ('{' in spacer) or ('}' in spacer)
-        return super(Space, self).__init__(spacer)
+        self.sentenceBreaker = not self.SENTENCE_BREAKERS.isdisjoint(spacer)
+        self.anyBreaker = self.sentenceBreaker or not self.ANY_BREAKERS.isdisjoint(
+            spacer)
+        return super(Space, self).__init__(spacer, start)
 
 
 class Word(SequenceUnit):
 
-    def __init__(self, word):
-        super(Word, self).__init__(word)
+    __slots__ = ('word_lower', 'caps', 'classes')
+
+    def __init__(self, word, start=0):
+        super(Word, self).__init__(word, start)
         if word:
-            # use lower-case word for comparing (current state)
-            self.word_lower = word.lower()
+            # use lower-case word for comparing (current state), interned
+            # because the same words keep appearing
+            self.word_lower = intern(word.lower())
             if self.original.isupper():
                 self.caps = 2  # all caps
             elif self.original[0].isupper():
@@ -282,9 +529,11 @@ class Word(SequenceUnit):
             self.flags = -1
             self.word_lower = ''
             self.caps = 0  # as lowercase
+        self.classes = MASKS.get(self.word_lower, 0)  # see Lexicon
 
     def replace(self, new_text):
-        self.word_lower = new_text.lower()
+        self.word_lower = intern(new_text.lower())
+        self.classes = MASKS.get(self.word_lower, 0)
         return super(Word, self).replace(new_text)
 
     def replace_autocap(self, new_text):
@@ -299,27 +548,27 @@ class Word(SequenceUnit):
         if self.flags != 1:
             self.flags = 2
 
-    NEAR_EXCEPTIONS = set(['', '/', u"…"])
+    NEAR_EXCEPTIONS = Sets.SET_NOT_NEAR
 
     def is_near(self):
         """Returns whether this word may be included as a "near" word"""
-        return not(self.word_lower in self.NEAR_EXCEPTIONS or self.word_lower.startswith('http://') or self.word_lower.startswith('https://'))
+        return not(self.classes & NOT_NEAR or self.word_lower.startswith(('http://', 'https://')))
 
     def is_common(self):
         """Returns whether this word may be considered a "common" word"""
-        return self.flags == 2 or self.word_lower in Sets.SET_COMMON
+        return self.flags == 2 or self.classes & COMMON != 0
 
     def is_article(self):
-        return self.word_lower in Sets.SET_ARTICLE
+        return self.classes & ARTICLE != 0
 
     def is_determiner(self):
-        return self.word_lower in Sets.SET_DETERMINER
+        return self.classes & DETERMINER != 0
 
     def is_conjunction_coordinating(self):
-        return self.word_lower in Sets.SET_CONJUNCTION_COORDINATING
+        return self.classes & CONJUNCTION_COORDINATING != 0
 
     def is_preposition(self):
-        return self.word_lower in Sets.SET_PREPOSITION_SHORT
+        return self.classes & PREPOSITION != 0
 
 #    def is_participle_past(self):
 #        if self.word_lower in ['been', 'thrown']:
@@ -330,16 +579,16 @@ class Word(SequenceUnit):
         return self.word_lower.endswith('ing')
 
     def is_pronoun_personal(self):
-        return self.word_lower in Sets.SET_PRONOUN_PERSONAL
+        return self.classes & PRONOUN_PERSONAL != 0
 
     def is_possessive(self):
-        return self.word_lower in Sets.SET_POSSESSIVE
+        return self.classes & POSSESSIVE != 0
 
     def is_possessive_determiner(self):
-        return self.word_lower in Sets.SET_DETERMINER_POSSESSIVE
+        return self.classes & POSSESSIVE_DETERMINER != 0
 
     def is_possessive_pronoun(self):
-        return self.word_lower in Sets.SET_PRONOUN_POSSESSIVE
+        return self.classes & POSSESSIVE_PRONOUN != 0
 
 
 class SequenceManager(list):
@@ -347,6 +596,38 @@ class SequenceManager(list):
     def __init__(self, *args, **kwargs):
         self.position = 0
         super(SequenceManager, self).__init__(*args, **kwargs)
+        self.build_index()
+
+    def load(self, units):
+        """Replace the units in place, as a new sequence"""
+        self[:] = units
+        self.position = 0
+        self.build_index()
+
+    def build_index(self):
+        """Count the words reachable from each word without crossing a breaker
+
+        The counts are indexed by word number (position / 2), in both
+        directions, for any breaker and for sentence breakers only. The
+        spaces never change their breakers, so they are only counted once.
+        """
+        words = len(self) // 2
+        self.prev_any = prev_any = [0] * words
+        self.prev_sentence = prev_sentence = [0] * words
+        self.next_any = next_any = [0] * words
+        self.next_sentence = next_sentence = [0] * words
+        for k in range(1, words):
+            space = self[2 * k - 1]
+            if not space.anyBreaker:
+                prev_any[k] = prev_any[k - 1] + 1
+            if not space.sentenceBreaker:
+                prev_sentence[k] = prev_sentence[k - 1] + 1
+        for k in range(words - 2, -1, -1):
+            space = self[2 * k + 1]
+            if not space.anyBreaker:
+                next_any[k] = next_any[k + 1] + 1
+            if not space.sentenceBreaker:
+                next_sentence[k] = next_sentence[k + 1] + 1
 
     def iter_words(self, start=0):
         """Returns an iterator that loops through the words."""
@@ -355,6 +636,12 @@ class SequenceManager(list):
             yield self[self.position]
             self.position += 2
 
+    def iter_positions(self, positions):
+        """Returns an iterator over the words at some positions."""
+        for position in positions:
+            self.position = position
+            yield self[position]
+
     def prev_has(self, words):
         """Determine whether there are at least n preceding words"""
         # @ 0: [ W ] S W S
@@ -364,24 +651,10 @@ class SequenceManager(list):
 
     def prev_has_continuous(self, words, already_checked=0, sentences=False):
         """Check if the previous n words are within the same block/sentence."""
-        if not self.prev_has(words):
-            return False
-        # check for lack of breakers
+        # already_checked words are within it too, so they need no special case
         if sentences:
-            for i in range(
-                    self.position - 1 - already_checked * 2,
-                    self.position - 1 - words * 2,
-                    -2):
-                if self[i].sentenceBreaker:
-                    return False
-        else:
-            for i in range(
-                    self.position - 1 - already_checked * 2,
-                    self.position - 1 - words * 2,
-                    -2):
-                if self[i].anyBreaker:
-                    return False
-        return True
+            return self.prev_sentence[self.position >> 1] >= words
+        return self.prev_any[self.position >> 1] >= words
 
     def next_has(self, words):
         """Determine whether there are at least n remaining words"""
@@ -392,47 +665,21 @@ class SequenceManager(list):
 
     def next_has_continuous(self, words, already_checked=0, sentences=False):
         """Check if the next n words are within the same block/sentence."""
-        if not self.next_has(words):
-            return False
-        # check for lack of breakers
         if sentences:  # pragma: no cover
-            for i in range(
-                    self.position + 1 + already_checked * 2,
-                    self.position + 1 + words * 2,
-                    2):
-                if self[i].sentenceBreaker:
-                    return False
-        else:
-            for i in range(
-                    self.position + 1 + already_checked * 2,
-                    self.position + 1 + words * 2,
-                    2):
-                if self[i].anyBreaker:
-                    return False
-        return True
+            return self.next_sentence[self.position >> 1] >= words
+        return self.next_any[self.position >> 1] >= words
 
     def prev_get_words_continuous(self, sentences=False):
         """Returns an list of the closest previous words until a breaker."""
         if not self.position:
             return []
-        i = self.position - 1
         if sentences:  # pragma: no cover
-            while i >= 0:  # 1
-                if self[i].sentenceBreaker:
-                    i -= 2
-                    break
-                i -= 2
+            words = self.prev_sentence[self.position >> 1]
         else:
-            while i >= 0:  # 1
-                if self[i].anyBreaker:
-                    i -= 2
-                    break
-                i -= 2
-        if i == -1:  # because -2 is needed to include 0, which is rerouted...
-            ret = self[self.position - 2:i + 1:-2]
-            ret.append(self[0])
-            return ret
-        return self[self.position - 2:i + 1:-2]
+            words = self.prev_any[self.position >> 1]
+        stop = self.position - 2 * words - 1  # the space before the last word
+        # NOTE: a breaker after the first word has never excluded that word
+        return self[self.position - 2:stop if stop > 1 else None:-2]
 
     def prev_word(self, n):
         """Get the nth previous word"""
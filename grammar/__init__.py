@@ -1,5 +1,24 @@
 #!/usr/bin/env python
 
-"""Public interface for grammar: grammar.CorrectionManager"""
+"""Public interface for grammar: grammar.CorrectionManager, grammar.Checker,
+grammar.CheckState, grammar.CorrectionResult,
+grammar.stream, grammar.ParallelChecker, grammar.ProfilingCorrectionManager,
+grammar.LRUCache, grammar.DiskCache, grammar.load_lexicon, grammar.dump_lexicon,
+grammar.AsyncCorrector (Python 3.6+)"""
 
+import sys
+
+from .Caching import DiskCache
+from .Caching import LRUCache
+from .Corrector import Checker
+from .Corrector import CheckState
 from .Corrector import CorrectionManager
+from .Corrector import CorrectionResult
+from .Parallel import ParallelChecker
+from .Profiling import ProfilingCorrectionManager
+from .Streaming import stream
+from .Units import dump_lexicon
+from .Units import load_lexicon
+
+if sys.version_info >= (3, 6):
+    from .Asynchronous import AsyncCorrector
@@ -0,0 +1,7 @@
+#!/usr/bin/env python
+
+"""Command-line interface: python -m grammar"""
+
+from .Streaming import main
+
+main()
@@ -5,11 +5,20 @@
 
 import grammar
 
+import io
 from io import StringIO
+import json
 import logging
 from logging import StreamHandler
 from logging.handlers import MemoryHandler
+import os
+import pickle
+import random
+import shutil
+import subprocess
 import sys
+import tempfile
+import time
 import unittest
 
 
@@ -67,6 +76,10 @@ class ParserFunctions(unittest.TestCase):
                 grammar.Transformers.transform(text, **options), expected)
         # do_decode_html
         check_transform('&#39;&quot;&gt;&lt;&amp;', '\'"><&')
+        check_transform('&amp;quot; &eacute;&#233;&#xE9;&#XE9; &#146;',
+                        u'&quot; éééé ’')
+        check_transform('AT&T &bogus; &#0; &#xD800; &#99999999;',
+                        'AT&T &bogus; &#0; &#xD800; &#99999999;')
         # do_ellipsis
         check_transform('...', u'…')
         # do_quotations
@@ -88,6 +101,171 @@ class ParserFunctions(unittest.TestCase):
         # do_fixnewline
         check_transform('1\n2 \n 3', '1 / 2 / 3')
 
+    def test_transform_fused(self):
+        """Fused transformations match applying every step in turn."""
+        Transformers = grammar.Transformers
+        names = ('do_decode_html', 'do_ellipsis', 'do_quotations', 'do_askfm',
+                 'do_fixcaps', 'do_fixi', 'do_fixnewline')
+
+        def sequential(text, options):
+            if options['do_decode_html']:
+                text = Transformers.decode_html(text)
+            if options['do_ellipsis']:
+                text = Transformers.compress_ellipsis(text)
+            if options['do_quotations']:
+                text = Transformers.remove_quotations(text)
+            if options['do_askfm']:
+                text = Transformers.remove_askfm(text)
+            if options['do_fixcaps']:
+                text = Transformers.fix_caps(text)
+            if options['do_fixi']:
+                text = Transformers.fix_i(text)
+            if options['do_fixnewline']:
+                text = Transformers.fix_newline(text)
+            return text
+        pieces = [u'&amp;', u'&quot;', u'&#39;', u'&lt;', u'&gt;', u'&', u'amp;',
+                  u'.', u'..', u'...', u' ', u'\n', u'\r\n', u'"', u'“', u'”',
+                  u'—', u'http://x', u'i', u"i'm", u'I', u'AB', u'Ab', u'ab']
+        rng = random.Random(99)
+        corpus = [u''.join(rng.choice(pieces) for _ in range(rng.randrange(12)))
+                  for _ in range(300)]
+        for n in range(1 << len(names)):
+            options = dict((name, bool(n & (1 << i)))
+                           for i, name in enumerate(names))
+            transform_ = Transformers.compile_transform(**options)
+            self.assertIs(transform_,
+                          Transformers.compile_transform(**options))
+            for text in corpus:
+                self.assertEqual(transform_(text), sequential(text, options),
+                                 (text, options))
+
+    def test_transform_offsets(self):
+        """The offset map follows every transformation back to the original text."""
+        Transformers = grammar.Transformers
+        names = ('do_decode_html', 'do_ellipsis', 'do_quotations', 'do_askfm',
+                 'do_fixcaps', 'do_fixi', 'do_fixnewline')
+        pieces = [u'&amp;', u'&quot;', u'&eacute;', u'.', u'...', u' ', u'\n',
+                  u'"', u'—', u' https://x', u'i', u"i'm", u'AB', u'ab']
+        rng = random.Random(14)
+        for _ in range(500):
+            text = u''.join(rng.choice(pieces) for _ in range(rng.randrange(12)))
+            options = dict((name, rng.random() < 0.5) for name in names)
+            transformed, offsets = Transformers.transform_offsets(text, **options)
+            self.assertEqual(transformed, Transformers.transform(text, **options))
+            previous = 0
+            for i in range(len(transformed)):
+                start, end = offsets.span(i, i + 1)
+                self.assertTrue(previous <= start <= end <= len(text))
+                previous = start
+            self.assertEqual(offsets.span(len(transformed), len(transformed)),
+                             (len(text), len(text)))
+        transformed, offsets = Transformers.transform_offsets(
+            u'AT&amp;T... I SAY YOUR\nTHE BEST', do_decode_html=True,
+            do_ellipsis=True, do_fixcaps=True, do_fixnewline=True)
+        self.assertEqual(transformed, u'At&t… I say your / the best')
+        self.assertEqual(offsets.span(0, 4), (0, 8))
+        self.assertEqual(offsets.span(4, 5), (8, 11))
+        self.assertEqual(offsets.span(12, 16), (18, 22))
+
+    def test_fix_caps(self):
+        """Counting and rewriting shouted text in one pass gives the same texts."""
+        Transformers = grammar.Transformers
+
+        def is_shouting(text):
+            words = [word for word in text.split()
+                     if not (word.startswith('@') or word.startswith('http://') or word.startswith('https://'))]
+            words_upper = len([word for word in words if word.isupper()])
+            words_title = len([word for word in words if word.istitle()])
+            return words_upper >= len(words) * 13 / 20 or words_title >= len(words) * 4 / 5
+        pieces = [u' ', u'  ', u'.', u'!', u'?', u'"', u',', u'\n', u'@ab',
+                  u'http://x', u'I', u'i', u"I'LL", u"i'd've", u'AB', u'Ab',
+                  u'ab', u'ÉT', u'1']
+        # Python 2 rounds the thresholds down, as it always did
+        self.assertEqual(Transformers.is_shouting(u'WOW ok'), sys.version_info < (3,))
+        self.assertEqual(Transformers.is_shouting(u'HELLO there friend'), sys.version_info < (3,))
+        rng = random.Random(13)
+        for _ in range(3000):
+            text = u''.join(rng.choice(pieces) for _ in range(rng.randrange(16)))
+            self.assertEqual(Transformers.is_shouting(text), is_shouting(text), text)
+            expected = text
+            if is_shouting(text):
+                expected = Transformers.REGEX_FIX_ALLCAPS.sub(
+                    Transformers.REGEX_FIX_ALLCAPS_REPL, text)
+                self.assertEqual(Transformers.fix_caps(text, do_fixi=False), expected)
+                expected = Transformers.fix_i(expected)
+            self.assertEqual(Transformers.fix_caps(text), expected, text)
+            self.assertEqual(Transformers.fix_caps_and_i(text),
+                             Transformers.fix_i(expected), text)
+
+    def test_partitionize(self):
+        """The regex tokenizer must match the character loop exactly."""
+        partitionize = grammar.Transformers.partitionize
+        partitionize_chars = grammar.Transformers.partitionize_chars
+
+        def units(sequence):
+            return [(type(unit), unit.original, unit.start) for unit in sequence]
+        alphabet = grammar.Transformers.SPACECHARS + u"ab-'\"\n\t…I"
+        rng = random.Random(1234)
+        corpus = [u'', u' ', u'a', u' a', u'a ', u'. a .', u'..a..b']
+        for _ in range(2000):
+            corpus.append(u''.join(rng.choice(alphabet)
+                                   for _ in range(rng.randrange(0, 16))))
+        for text in corpus:
+            self.assertEqual(units(partitionize(text)),
+                             units(partitionize_chars(text)), text)
+            for unit in partitionize(text):
+                self.assertEqual(text[unit.start:unit.get_end()], unit.original)
+        self.assertEqual(units(partitionize(u'')),
+                         [(grammar.Units.Word, u'', 0), (grammar.Units.Space, u'', 0)])
+
+    def test_units_compact(self):
+        """Units have no instance dictionary and share their lowercase words."""
+        word = grammar.Units.Word(u'Hello')
+        space = grammar.Units.Space(u', ')
+        self.assertFalse(hasattr(word, '__dict__'))
+        self.assertFalse(hasattr(space, '__dict__'))
+        self.assertTrue(space.anyBreaker)
+        self.assertFalse(space.sentenceBreaker)
+        if sys.version_info >= (3,):
+            # Python 2 cannot intern unicode strings
+            self.assertIs(word.word_lower, grammar.Units.Word(u'HELLO').word_lower)
+
+    def test_sequence_index(self):
+        """Continuity checks agree with scanning the spaces one by one."""
+        rng = random.Random(4321)
+        for _ in range(500):
+            text = u''.join(rng.choice(u'ab .,!? ;')
+                            for _ in range(rng.randrange(0, 16)))
+            sequence = grammar.Units.SequenceManager(
+                grammar.Transformers.partitionize(text))
+            for position in range(0, len(sequence), 2):
+                sequence.position = position
+                for sentences in (False, True):
+                    def breaks(i):
+                        if sentences:
+                            return sequence[i].sentenceBreaker
+                        return sequence[i].anyBreaker
+                    for words in range(4):
+                        self.assertEqual(
+                            sequence.prev_has_continuous(
+                                words, sentences=sentences),
+                            position >= 2 * words and not any(
+                                breaks(position - 1 - 2 * j) for j in range(words)))
+                        self.assertEqual(
+                            sequence.next_has_continuous(
+                                words, sentences=sentences),
+                            position + 2 * words < len(sequence) and not any(
+                                breaks(position + 1 + 2 * j) for j in range(words)))
+                    # words before the current one, up to a breaker (which
+                    # never excludes the first word)
+                    expected = []
+                    for i in range(position - 2, -1, -2):
+                        if i and breaks(i + 1):
+                            break
+                        expected.append(sequence[i])
+                    self.assertEqual(
+                        sequence.prev_get_words_continuous(sentences), expected)
+
     # Parser Tests
     def test_load_regular(self):
         """Try to properly load a regular sentence."""
@@ -305,6 +483,17 @@ class ParserFunctions(unittest.TestCase):
         self.positive("Its there own item", "[It's their] own item")
         self.positive("Your don't supposed to!", "[You aren't] supposed to!")
 
+    def test_rerun(self):
+        """Reruns only revisit the words near a change, like a full rescan."""
+        self.positive("its you're own", "[it's your] own")
+        self.positive("Whose it's own thing", "[Who's its] own thing")
+        self.positive("your there own", "[you're their] own")
+        self.positive("to each there own. Your you're own",
+                      "to each [their] own. [You're your] own")
+        self.positive("your it's own and your don't supposed to",
+                      "[you're its] own and [you aren't] supposed to")
+        self.positive("Its in your you're own", "[It's] in [you're your] own")
+
     def test_punctuation(self):
         # Keep question marks and exclamation marks
         self.positive("their is?", "[there] is?")
@@ -320,6 +509,661 @@ class ParserFunctions(unittest.TestCase):
         self.positive("their is,", "[there] is")
         self.positive("their is;", "[there] is")
 
+    def test_load_texts(self):
+        """Batches give the same detections as loading texts one by one."""
+        texts = [
+            "This sentence is fine.",
+            "Your the best",
+            "Their is and your don't supposed to!",
+            "THEIR is",
+            "",
+        ]
+        results = self.parser.check_batch(texts, **self.options)
+        self.assertEqual(len(results), len(texts))
+        for text, result in zip(texts, results):
+            self.parser.reset()
+            expected = self.parser.load_text(text, **self.options)
+            self.assertEqual(bool(result), expected)
+            self.assertEqual(result.corrections, self.parser.corrections)
+            self.assertEqual(result.corrected, self.parser.corrected)
+        self.assertEqual(results[1].corrections, ["[You're] the best"])
+        self.assertEqual(list(results[1].corrected), ['your'])
+        self.assertFalse(results[0])
+
+    def test_spans(self):
+        """Corrected words are located in the text before its transformations."""
+        text = u'&quot;hi there&quot; &amp;... YOUR THE BEST\nTHEIR IS'
+        options = dict(self.options, do_decode_html=True, do_ellipsis=True,
+                       do_fixcaps=True)
+        self.parser.reset()
+        self.assertTrue(self.parser.load_text(text, **options))
+        self.assertEqual([(text[start:end], replacement)
+                          for start, end, replacement in self.parser.get_spans()],
+                         [(u'YOUR', u"you're"), (u'THEIR', u'there')])
+        self.parser.reset()
+        self.assertFalse(self.parser.load_text(u'fine', **options))
+        self.assertEqual(self.parser.get_spans(), [])
+
+    def test_details(self):
+        """Corrections are also given as structures, rendered on demand."""
+        self.parser.reset()
+        self.assertTrue(self.parser.load_text(
+            "Their is and your don't supposed to!", **self.options))
+        self.assertEqual([str(correction) for correction in self.parser.details],
+                         self.parser.corrections)
+        correction, = self.parser.details
+        self.assertEqual(correction.changes, [
+            (0, 'their_be', 'Their', 'There'),
+            (6, 'your-are', 'your', 'you'),  # from the rerun
+            (8, 'supposed-to', "don't", "aren't"),
+        ])
+        self.assertEqual(correction.get_indices(), [0, 6, 8])
+        self.assertEqual(correction.get_kinds(), ['their_be', 'your-are', 'supposed-to'])
+        self.assertEqual((correction.start, correction.end), (0, 13))
+        self.assertEqual(correction.get_original(), "Their is and your don't supposed to")
+        self.assertEqual(correction.get_replacement(), "There is and you aren't supposed to")
+        self.assertEqual(correction.punctuation, '!')
+        self.parser.reset()
+        self.assertTrue(self.parser.load_text("they're is a cow", **self.options))
+        self.assertEqual(self.parser.details[0].changes,
+                         [(0, 'theyre_be', "they're", "there's"), (1, 'theyre_be', ' ', ''),
+                          (2, 'theyre_be', 'is', '')])
+
+    def test_lazy(self):
+        """Corrections are only generated when they are needed."""
+        text = "Their is and your don't supposed to!"
+        self.parser.reset()
+        self.assertTrue(self.parser.load_text(text, **self.options))
+        self.assertIsNone(self.parser._corrections)
+        self.assertEqual(self.parser.corrections,
+                         ["[There] is and [you aren't] supposed to!"])
+        # callers may still assign the corrections
+        self.parser.corrections = []
+        self.assertEqual(self.parser.corrections, [])
+        self.parser.corrections = None
+        self.assertEqual(self.parser.corrections,
+                         ["[There] is and [you aren't] supposed to!"])
+        detector = grammar.CorrectionManager(detect_only=True)
+        self.assertTrue(detector.load_text(text, **self.options))
+        self.assertEqual(detector.corrected, self.parser.corrected)
+        self.assertEqual(detector.corrections, [])
+        self.assertEqual(detector.kinds, {})
+        detector.reset()
+        self.assertFalse(detector.load_text("This sentence is fine.", **self.options))
+        result, = self.parser.check_batch([text], **self.options)
+        self.assertIsNone(result._corrections)
+        copy = pickle.loads(pickle.dumps(result, pickle.HIGHEST_PROTOCOL))
+        self.assertIsNone(copy.sequence)
+        self.assertEqual(copy.corrections, result.corrections)
+        self.assertEqual((copy.kinds, copy.details), (result.kinds, []))
+        # the details are only pickled once they were accessed
+        copy = pickle.loads(pickle.dumps(result, pickle.HIGHEST_PROTOCOL))
+        self.assertEqual([correction.changes for correction in copy.details],
+                         [correction.changes for correction in result.details])
+
+    def test_pooled(self):
+        """Pooled managers reuse their units without changing any detection."""
+        texts = [
+            "one two three four five six seven eight nine of ten",
+            "Your the best",
+            "a b c d e f g h their is",
+            "This sentence is fine, you know",
+            "I should of went there",
+            "Their is and your don't supposed to!",
+        ] * 3
+        pooled = grammar.CorrectionManager(pooled=True)
+        expected = self.parser.check_batch(texts, **self.options)
+        results = pooled.check_batch(texts, **self.options)
+        self.assertEqual([result.corrections for result in results],
+                         [result.corrections for result in expected])
+        pooled.reset()
+        self.assertFalse(pooled.load_text("a b c d e f g of i", **self.options))
+        pool = pooled.pool
+        unit = pool[0]
+        pooled.reset()
+        self.assertFalse(pooled.load_text("nothing to see of here at all", **self.options))
+        self.assertIs(pooled.pool, pool)
+        self.assertIs(pooled.sequence[0], unit)
+        self.assertEqual(len(pool), 18)  # only grows
+        self.assertEqual(''.join(map(str, pooled.sequence)), "nothing to see of here at all")
+        self.assertEqual(pooled.sequence.prev_any, list(range(7)))
+        pooled.reset()
+        self.assertTrue(pooled.load_text("your the best", **self.options))
+        self.assertEqual(pooled.corrections, ["[you're] the best"])
+        pooled.reset()
+        self.assertIs(pooled.pool, pool)
+        self.assertTrue(pooled.load_text("your the best", **self.options))
+        details = pooled.details
+        pooled.reset()
+        # the units now belong to the details
+        self.assertIsNot(pooled.pool, pool)
+        self.assertFalse(pooled.load_text("the best of all", **self.options))
+        self.assertEqual(details[0].render(), "[you're] the best")
+
+    def test_details_unicode(self):
+        """Corrections with non-ASCII words are rendered as text."""
+        self.parser.reset()
+        self.assertTrue(self.parser.load_text(u'Your the caf\xe9...', do_ellipsis=True))
+        self.assertEqual(self.parser.corrections, [u"[You're] the caf\xe9\u2026"])
+
+    def test_profiling(self):
+        """The profiling manager counts every rule without changing any detection."""
+        texts = [
+            "Your the best",
+            "Their is and your don't supposed to!",
+            "your own car",
+            "This sentence is fine.",
+            "I should of went there",
+            "It could of course rain",
+        ]
+        profiler = grammar.ProfilingCorrectionManager(exits=True)
+        expected = self.parser.check_batch(texts, **self.options)
+        results = profiler.check_batch(texts, **self.options)
+        self.assertEqual([result.corrections for result in results],
+                         [result.corrections for result in expected])
+        counters = profiler.get_counters()
+        for name, stats in counters['rules'].items():
+            self.assertEqual(stats['invocations'], stats['matches'] + sum(
+                exit['count'] for exit in stats['exits'].values()), name)
+        self.assertEqual(counters['rules']['supposed_to']['matches'], 1)
+        self.assertEqual(counters['rules']['your_are']['matches'], 1)
+        exits = list(counters['rules']['of']['exits'].values())
+        self.assertEqual(exits, [{'count': 1, 'reason': "if next_word_1.word_lower == 'course':"}])
+        # the rules compiled from patterns exit at their exceptions
+        profiler_then = grammar.ProfilingCorrectionManager(exits=True)
+        profiler_then.check_batch(["if we can do better then you", "so then"])
+        exits = profiler_then.get_counters()['rules']['then']['exits']
+        self.assertEqual(sorted(exit['reason'] for exit in exits.values()),
+                         ['"if|when ... <then.comparative> _",', 'no pattern matched'])
+        self.assertEqual(counters['stages']['transform']['calls'], len(texts))
+        self.assertEqual(counters['stages']['do_checks_all']['calls'], 5)
+        # the results generate their own corrections
+        self.assertEqual(counters['stages']['generate_texts']['calls'], 0)
+        profiler.reset()
+        profiler.load_text(texts[0], **self.options)
+        self.assertEqual(profiler.corrections, ["[You're] the best"])
+        self.assertEqual(profiler.stages['generate_texts']['calls'], 1)
+        self.assertEqual(profiler.stages['generate_details']['calls'], 1)
+        prometheus = profiler.get_prometheus()
+        self.assertIn('grammar_rule_matches_total{rule="of"} 1\n', prometheus)
+        self.assertIn('reason="if next_word_1.word_lower == \'course\':"} 1\n', prometheus)
+        self.assertIn('grammar_stage_calls_total{stage="transform"} 7\n', prometheus)
+        self.assertIn('# TYPE grammar_rule_seconds_total counter\n', prometheus)
+        # the exits are only recorded on demand
+        profiler = grammar.ProfilingCorrectionManager()
+        profiler.load_text("your own car", **self.options)
+        self.assertEqual(profiler.get_counters()['rules']['possessive_as_be'],
+                         {'invocations': 1, 'matches': 0, 'exits': {},
+                          'seconds': profiler.rules['possessive_as_be']['seconds']})
+        self.assertIs(grammar.CorrectionManager.dispatch, grammar.Corrections.DISPATCH)
+
+    def test_cache(self):
+        """Cached results are the same as fresh ones."""
+        texts = [
+            "Your the best",
+            "Their is and your don't supposed to!",
+            "This sentence is fine, of course",
+            "YOUR THE BEST",
+            "nothing at all",
+        ] * 3
+        options = dict(self.options, do_fixcaps=True)
+        cache = grammar.Caching.LRUCache()
+        cached = grammar.CorrectionManager(cache=cache)
+        for text in texts:
+            self.parser.reset()
+            cached.reset()
+            self.assertEqual(cached.load_text(text, **options),
+                             self.parser.load_text(text, **options))
+            self.assertEqual(cached.corrected, self.parser.corrected)
+            self.assertEqual(cached.corrections, self.parser.corrections)
+            self.assertEqual(cached.get_spans(), self.parser.get_spans())
+            self.assertEqual([correction.as_dict() for correction in cached.details],
+                             [correction.as_dict() for correction in self.parser.details])
+        # "nothing at all" has no keyword, and "YOUR THE BEST" is transformed
+        # into "Your the best"
+        self.assertEqual(cache.get_stats(), {
+            'size': 3, 'hits': 9, 'misses': 3, 'hit_rate': 0.75,
+            'evictions': 0, 'expirations': 0})
+        detector = grammar.CorrectionManager(detect_only=True, cache=cache)
+        self.assertTrue(detector.load_text("Your the best"))
+        self.assertEqual(len(cache), 4)
+        self.assertEqual(cached.check_batch(["Your the best"])[0].corrections,
+                         ["[You're] the best"])
+
+    def test_disk_cache(self):
+        """The disk cache is shared, and forgets the results of other rules."""
+        directory = tempfile.mkdtemp()
+        try:
+            path = os.path.join(directory, 'cache.db')
+            texts = ["Your the best", "Their is and your don't supposed to!",
+                     "This sentence is fine, of course"]
+            expected = self.parser.check_batch(texts, **self.options)
+            cache = grammar.DiskCache(path)
+            results = grammar.CorrectionManager(cache=cache).check_batch(
+                texts, **self.options)
+            self.assertEqual(len(cache), 3)
+            # another process
+            other = grammar.DiskCache(path)
+            results_other = grammar.CorrectionManager(cache=other).check_batch(
+                texts, **self.options)
+            self.assertEqual(other.get_stats()['hits'], 3)
+            for result in (results, results_other):
+                self.assertEqual([(sorted(r.corrected), r.corrections) for r in result],
+                                 [(sorted(r.corrected), r.corrections) for r in expected])
+            other.close()
+            cache.close()
+            now = [0.0]
+            cache = grammar.DiskCache(path, ttl=10, clock=lambda: now[0])
+            cache.set((u'x', False), expected[0])
+            self.assertEqual(cache.get((u'x', False)).corrections, expected[0].corrections)
+            now[0] = 10.0
+            self.assertIsNone(cache.get((u'x', False)))
+            self.assertEqual(cache.get_stats()['hits'], 1)
+            # the flags are stored as they are
+            cache.set((u'y', False), grammar.CorrectionResult(u'y', {u'kind': 2}))
+            self.assertEqual(cache.get((u'y', False)).corrected, {u'kind': 2})
+            # the new results are written in batches
+            self.assertIsNone(grammar.DiskCache(path).get((u'y', False)))
+            cache.flush()
+            self.assertEqual(grammar.DiskCache(path).get((u'y', False)).corrected, {u'kind': 2})
+            # byte strings are UTF-8 text
+            self.assertEqual(cache.hash_key((b'caf\xc3\xa9', False)),
+                             cache.hash_key((u'caf\xe9', False)))
+            cache.close()
+            cache = grammar.DiskCache(path, version='other rules')
+            self.assertEqual(len(cache), 0)
+            self.assertEqual(cache.hash_key((u'x', False)),
+                             grammar.DiskCache(path, version='other rules').hash_key((u'x', False)))
+            self.assertNotEqual(cache.hash_key((u'x', False)),
+                                grammar.DiskCache(path).hash_key((u'x', False)))
+            cache.close()
+            with grammar.ParallelChecker(2, 2, cache_path=path, **self.options) as checker:
+                self.assertEqual([r.corrections for r in checker.check(texts * 2)],
+                                 [r.corrections for r in expected * 2])
+            self.assertEqual(len(grammar.DiskCache(path)), 3)
+        finally:
+            shutil.rmtree(directory)
+
+    @unittest.skipUnless(hasattr(grammar, 'AsyncCorrector'), 'Python 3.6+')
+    def test_async(self):
+        """The asynchronous checker batches small texts and bounds the queue."""
+        import asyncio
+        from concurrent.futures import ThreadPoolExecutor
+        batches = []
+
+        class CountingExecutor(ThreadPoolExecutor):
+            def submit(self, function, texts, options):
+                batches.append(len(texts))
+                return super(CountingExecutor, self).submit(function, texts, options)
+        texts = ["Your the best", "This sentence is fine.", "Their is",
+                 "I should of went there", "ok"] * 2 + ["Their is " + "blah " * 100]
+        expected = [result.corrections for result in
+                    self.parser.check_batch(texts, **self.options)]
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        executor = CountingExecutor(1)
+        corrector = grammar.AsyncCorrector(executor, queue_depth=4, **self.options)
+        try:
+            results = loop.run_until_complete(
+                asyncio.gather(*[corrector.check(text) for text in texts]))
+            self.assertEqual([result.corrections for result in results], expected)
+            # the batches depend on the scheduling
+            self.assertTrue(max(batches) <= 4)
+            self.assertEqual(sum(batches), len(texts))
+            del batches[:]
+            stream = corrector.check_stream(iter(texts))
+            results = []
+            while True:
+                try:
+                    results.append(loop.run_until_complete(stream.__anext__()))
+                except StopAsyncIteration:
+                    break
+            self.assertEqual([result.corrections for result in results], expected)
+            self.assertTrue(max(batches) <= 4)
+            self.assertEqual(sum(batches), len(texts))
+            self.assertRaises(asyncio.TimeoutError, loop.run_until_complete,
+                              corrector.check("Your the best", timeout=0))
+            self.assertEqual(loop.run_until_complete(corrector.check("Their is")).corrections,
+                             [u'[There] is'])
+            # async with, which Python 2 cannot parse
+            own = loop.run_until_complete(grammar.AsyncCorrector(**self.options).__aenter__())
+            self.assertEqual(loop.run_until_complete(own.check("Their is")).corrections,
+                             [u'[There] is'])
+            loop.run_until_complete(own.__aexit__(None, None, None))
+            self.assertRaises(RuntimeError, own.executor.submit, len, u'')
+        finally:
+            asyncio.set_event_loop(None)
+            loop.close()
+            executor.shutdown()
+
+    def test_checker(self):
+        """A checker gives the same results as a manager."""
+        texts = ["Your the best", "This sentence is fine.", "Their is",
+                 "YOUR THE BEST", "I should of went there", "ok"]
+        expected = self.parser.check_batch(texts, **self.options)
+        checker = grammar.Checker(**self.options)
+        results = checker.check_batch(texts)
+        self.assertEqual([(r.text, r.corrected, r.corrections) for r in results],
+                         [(r.text, r.corrected, r.corrections) for r in expected])
+        self.assertEqual([c.as_dict() for c in results[0].details],
+                         [c.as_dict() for c in expected[0].details])
+        result = grammar.Checker(detect_only=True, **self.options).check("Their is")
+        self.assertEqual((list(result.corrected), result.corrections), (['their_be'], []))
+        # the rules run on any state
+        state = grammar.CheckState(grammar.Corrections.DISPATCH, grammar.Units.SequenceManager(
+            grammar.Transformers.partitionize(u"Their is")))
+        state.do_checks_all()
+        self.assertEqual(list(state.corrected), ['their_be'])
+
+    def test_checker_threads(self):
+        """Many threads can share the same checker."""
+        import threading
+        rng = random.Random(0)
+        texts = ["Your the best", "This sentence is fine.", "Their is and your don't supposed to!",
+                 "I should of went there", "Whose been there?", "this is better then that",
+                 "THEIR MUST BE SOMETHING!", "people whom are", "ok"] * 20
+        expected = dict((text, result.corrections) for text, result in
+                        zip(texts, self.parser.check_batch(texts, **self.options)))
+        checker = grammar.Checker(**self.options)
+        failures = []
+
+        def check(texts):
+            for text in texts:
+                corrections = checker.check(text).corrections
+                if corrections != expected[text]:
+                    failures.append((text, corrections))
+        threads = []
+        for _ in range(16):
+            texts = texts[:]
+            rng.shuffle(texts)
+            threads.append(threading.Thread(target=check, args=(texts,)))
+        # switch threads as often as possible (Python 3 only)
+        switching = hasattr(sys, 'getswitchinterval')
+        if switching:
+            interval = sys.getswitchinterval()
+            sys.setswitchinterval(1e-6)
+        try:
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        finally:
+            if switching:
+                sys.setswitchinterval(interval)
+        self.assertEqual(failures, [])
+
+    def test_patterns(self):
+        """Patterns match words around the keyword, with windows and exceptions."""
+        Pattern = grammar.Patterns.Pattern
+
+        def match(pattern, text, keyword):
+            sequence = grammar.Units.SequenceManager(grammar.Transformers.partitionize(text))
+            for cur in sequence.iter_words():
+                if cur.word_lower == keyword:
+                    return pattern.match(sequence)
+        pattern = Pattern("<determiner> very? [big] !car|<pronoun_personal>", "= ~ ~ =")
+        self.assertEqual(pattern.keywords, frozenset(['big']))
+        self.assertEqual(match(pattern, "the big house", 'big'), [(0, '~')])
+        self.assertEqual(match(pattern, "the very big house", 'big'), [(-2, '~'), (0, '~')])
+        self.assertIsNone(match(pattern, "the very big car", 'big'))
+        self.assertIsNone(match(pattern, "the very big you", 'big'))
+        self.assertIsNone(match(pattern, "the, big house", 'big'))
+        pattern = Pattern("if ... better _", "~ ^than", unless=("_ <nofollow>",),
+                          classes={'nofollow': set(['be'])})
+        self.assertIsNone(pattern.keywords)
+        self.assertEqual(match(pattern, "if we can do better then you", 'then'), [(-2, '~'), (0, '^than')])
+        self.assertEqual(match(pattern, "if better then you", 'then'), [(-2, '~'), (0, '^than')])
+        self.assertIsNone(match(pattern, "we can do better then you", 'then'))
+        self.assertIsNone(match(pattern, "if, we can do better then you", 'then'))
+        self.assertIsNone(match(pattern, "if we can do better then be", 'then'))
+        for src, dst in (("there own", None), ("_ _", None), ("_ ... a ... b", None),
+                         ("_ <unknown>", None), ("there _", "~")):
+            self.assertRaises(grammar.Patterns.PatternError, Pattern, src, dst)
+        # the first matching pattern of a rule is applied
+        self.positive("I am hear")
+        self.assertEqual(self.parser.corrections, ["I am [here]"])
+        self.positive("They are board with it")
+        self.assertEqual(self.parser.corrections, ["They are [bored] with it"])
+        # the first word counts as before the breaker after it, as it always has
+        self.positive("There. Own it")
+        self.assertEqual(self.parser.corrections, ["[Their]"])
+        self.positive("Worse. Better then you")
+        self.assertEqual(self.parser.corrections, ["Better [than] you"])
+        self.negative("So, worse. Better then you")
+
+    def test_lexicon(self):
+        """The classes of the words are bits of their mask."""
+        Units = grammar.Units
+        word = Units.Word(u'The')
+        self.assertEqual(word.classes, Units.LEXICON.masks['the'])
+        self.assertTrue(word.is_article() and word.is_determiner() and word.is_common())
+        self.assertFalse(word.is_preposition())
+        word.replace(u'about')
+        self.assertTrue(word.is_preposition() and not word.is_article())
+        word.replace(u'zebra')
+        self.assertEqual(word.classes, 0)
+        self.assertFalse(word.is_common())
+        word = Units.Word(u'zebra')
+        word.mark_common()
+        self.assertTrue(word.is_common())
+        self.assertFalse(Units.Word(u'').is_near())
+        self.assertFalse(Units.Word(u'https://t.co').is_near())
+        self.assertTrue(Units.Word(u'zebra').is_near())
+        for name, words in (('article', Units.Sets.SET_ARTICLE),
+                            ('common', Units.Sets.SET_COMMON),
+                            ('possessive', Units.Sets.SET_POSSESSIVE)):
+            self.assertEqual(Units.LEXICON.get_words(name), words)
+        lexicon = Units.Lexicon()
+        animal = lexicon.add('animal', ['Cat', 'dog'])
+        pet = lexicon.add('pet', ['dog'])
+        self.assertEqual((animal, pet), (1, 2))
+        self.assertEqual(lexicon.add('animal', ['zebra']), animal)
+        self.assertEqual(lexicon.masks, {'cat': 1, 'dog': 3, 'zebra': 1})
+        self.assertEqual(lexicon.get_words('animal'), set(['cat', 'dog', 'zebra']))
+
+    def test_load_lexicon(self):
+        """Lexicon files replace the classes and the maps used by the rules."""
+        Units = grammar.Units
+        lexicon = Units.Lexicon()
+        lexicon.add('animal', ['cat', 'dog'])
+        lexicon.add_map('plural', {'cat': 'cats'})
+        copy = Units.Lexicon()
+        copy.load(json.loads(lexicon.dump(version='1')))
+        self.assertEqual(copy.get_classes(), {'animal': set(['cat', 'dog'])})
+        self.assertEqual(copy.get_map('plural'), {'cat': 'cats'})
+        self.assertEqual((copy.version, copy.get_digest()), ('1', lexicon.get_digest()))
+        self.assertRaises(ValueError, copy.load, {'format': 0})
+        directory = tempfile.mkdtemp()
+        path = os.path.join(directory, 'lexicon.json')
+        defaults = os.path.join(directory, 'defaults.json')
+        grammar.dump_lexicon(defaults)
+        version = grammar.Caching.ruleset_version()
+        texts = [u'He is better then me.', u'He is faster then me.', u'I could of ran.']
+        parser = grammar.CorrectionManager(cache=grammar.LRUCache())
+        self.assertEqual([result.corrections for result in parser.check_batch(texts)],
+                         [['He is better [than] me'], [], ["I could['ve run]"]])
+        try:
+            with io.open(path, 'w', encoding='utf-8') as f:
+                f.write(u'{"format": 1, "version": "test",\n'
+                        u'"classes": {"then.comparative": ["faster"]},\n'
+                        u'"maps": {"of.past_to_participle": {"went": "gone"}}}\n')
+            grammar.load_lexicon(path)
+            self.assertEqual(Units.LEXICON.version, 'test')
+            self.assertNotEqual(grammar.Caching.ruleset_version(), version)
+            # the results cached before the lexicon are not used
+            self.assertEqual([result.corrections for result in parser.check_batch(texts)],
+                             [[], ['He is faster [than] me'], ["I could['ve] ran"]])
+        finally:
+            grammar.load_lexicon(defaults)
+            shutil.rmtree(directory)
+        self.assertEqual(grammar.Caching.ruleset_version(), version)
+
+    def test_derived_classes(self):
+        """The derived classes follow the classes they are made of."""
+        Units = grammar.Units
+        lexicon = Units.Lexicon()
+        lexicon.add('article', ['a', 'the'])
+        lexicon.add('pronoun', ['he'])
+        lexicon.derive('determiner', ['article'], ['this'])
+        lexicon.derive('common', ['determiner', 'pronoun'])
+        lexicon.add('article', ['an'])
+        lexicon.set_class('pronoun', ['she'])
+        self.assertEqual(lexicon.get_words('common'), set(['a', 'an', 'the', 'this', 'she']))
+        lexicon.load({'format': Units.LEXICON_FORMAT,
+                      'classes': {'article': ['the'], 'determiner': ['that']}})
+        self.assertEqual(lexicon.get_words('determiner'), set(['the', 'that']))
+        self.assertEqual(lexicon.get_words('common'), set(['the', 'that', 'she']))
+        directory = tempfile.mkdtemp()
+        path = os.path.join(directory, 'lexicon.json')
+        defaults = os.path.join(directory, 'defaults.json')
+        grammar.dump_lexicon(defaults)
+        version = grammar.Caching.ruleset_version()
+        modal = Units.LEXICON.get_words('theyre_be.modal')
+        try:
+            with io.open(path, 'w', encoding='utf-8') as f:
+                f.write(u'{"format": 1, "classes": {"article": ["a", "an", "the", "yon"],\n'
+                        u'"of.modal": ["would", "might"]}}\n')
+            grammar.load_lexicon(path)
+            self.assertTrue(Units.Word(u'yon').is_common())
+            self.assertEqual(Units.LEXICON.get_words('theyre_be.modal'),
+                             Units.LEXICON.get_words('be_noun.be') | set(['would', 'might']))
+            # the built-in words, edited
+            data = json.loads(Units.LEXICON.dump())
+            data['classes']['article'].remove('the')
+            Units.LEXICON.load(data)
+            self.assertFalse(Units.Word(u'the').is_common())
+            self.assertNotIn('the', Units.LEXICON.get_words('determiner'))
+        finally:
+            grammar.load_lexicon(defaults)
+            shutil.rmtree(directory)
+        self.assertFalse(Units.Word(u'yon').is_common())
+        self.assertTrue(Units.Word(u'the').is_common())
+        self.assertEqual(Units.LEXICON.get_words('theyre_be.modal'), modal)
+        self.assertEqual(grammar.Caching.ruleset_version(), version)
+
+    def test_lru_cache(self):
+        """The cache forgets the least recently used and the expired results."""
+        now = [0]
+        cache = grammar.Caching.LRUCache(2, ttl=10, clock=lambda: now[0])
+        cache.set('a', 1)
+        cache.set('b', 2)
+        self.assertEqual(cache.get('a'), 1)
+        cache.set('c', 3)  # forgets 'b'
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('c'), 3)
+        now[0] = 5
+        cache.set('a', 4)
+        now[0] = 12
+        self.assertIsNone(cache.get('c'))
+        self.assertEqual(cache.get('a'), 4)
+        stats = cache.get_stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['evictions'],
+                          stats['expirations'], stats['size']), (3, 2, 1, 1, 1))
+
+    def test_prefilter(self):
+        """The keyword prefilter must not change any detection."""
+        prefilter = self.parser.prefilter
+        self.assertFalse(prefilter.search("This sentence is fine."))
+        self.assertFalse(prefilter.search("yours, whoever, ownership"))
+        self.assertTrue(prefilter.search("WHOSE"))
+        self.assertTrue(prefilter.search("(you're)"))
+        texts = [
+            "This sentence is fine.",
+            "YOUR the best",
+            "(your) the best",
+            '"your the best"',
+            "yours are the best",
+            "your-are",
+            "I am HEAR!",
+            "Its there own item",
+            "[whom] is",
+            "sees it's own",
+        ]
+        unfiltered = grammar.CorrectionManager()
+        unfiltered.prefilter = None
+        for text in texts:
+            self.parser.reset()
+            unfiltered.reset()
+            self.assertEqual(self.parser.load_text(text, **self.options),
+                             unfiltered.load_text(text, **self.options))
+            self.assertEqual(self.parser.corrections, unfiltered.corrections)
+            self.assertEqual(self.parser.corrected, unfiltered.corrected)
+
+    def test_stream(self):
+        """Only records with detections are streamed, in order."""
+        lines = iter([
+            u'Your the best\n',
+            u'This sentence is fine.\n',
+            u'{"id": 1, "text": "Their is"}\n',
+            u'{"id": 2}\n',
+            u'{not json, but their is\n',
+        ])
+        results = list(grammar.stream(lines, **self.options))
+        self.assertEqual([record for record, result in results], [
+            u'Your the best', {u'id': 1, u'text': u'Their is'},
+            u'{not json, but their is'])
+        self.assertEqual(results[1][1].corrections, [u'[There] is'])
+        self.assertEqual(list(results[1][1].corrected), [u'their_be'])
+        # Command-line interface
+        stdout = StringIO()
+        grammar.Streaming.main(['--quotations'], iter([
+            u'This sentence is fine.\n', u'{"id": 3, "body": "your are"}\n',
+        ]), stdout)
+        self.assertEqual(stdout.getvalue(), u'')
+        grammar.Streaming.main(['--key', 'body'], iter([
+            u'{"id": 3, "body": "your are"}\n',
+        ]), stdout)
+        self.assertEqual(
+            stdout.getvalue(),
+            u'{"body": "your are", "corrected": ["your-are"], '
+            u'"corrections": ["[you] are"], "details": [{"changes": '
+            u'[[0, "your-are", "your", "you"]], "end": 3, "kinds": ["your-are"], '
+            u'"original": "your are", "replacement": "you are", "start": 0, '
+            u'"text": "[you] are"}], "id": 3}\n')
+        # plain-text lines are read as UTF-8
+        stdout = StringIO()
+        grammar.Streaming.main([], io.BytesIO(b'caf\xc3\xa9 your are\n'), stdout)
+        self.assertEqual(json.loads(stdout.getvalue())['corrections'],
+                         [u'caf\xe9 [you] are'])
+        process = subprocess.Popen([sys.executable, '-m', 'grammar'], stdin=subprocess.PIPE,
+                                   stdout=subprocess.PIPE,
+                                   cwd=os.path.dirname(os.path.abspath(__file__)))
+        output = process.communicate(b'caf\xc3\xa9 your are\n')[0]
+        self.assertEqual(process.returncode, 0)
+        self.assertEqual(json.loads(output.decode('utf-8'))['text'], u'caf\xe9 your are')
+
+    def test_parallel(self):
+        """Worker processes give the same results as a single manager."""
+        texts = ["Your the best", "This sentence is fine.", "Their is",
+                 "I should of went there", "ok"] * 3
+        expected = [result.corrections for result in
+                    self.parser.check_batch(texts, **self.options)]
+        with grammar.ParallelChecker(2, 4, **self.options) as checker:
+            self.assertEqual(
+                [result.corrections for result in checker.check(texts)],
+                expected)
+            unordered = sorted(
+                (i, result.corrections)
+                for i, result in checker.check_unordered(texts))
+            self.assertEqual(unordered, list(enumerate(expected)))
+            self.assertEqual([result.details for result in checker.check(texts)][0], [])
+        with grammar.ParallelChecker(2, 4, details=True, max_pending=2, **self.options) as checker:
+            results = list(checker.check(texts))
+            self.assertEqual([correction.changes for correction in results[0].details],
+                             [[(0, 'your', 'Your', "You're")]])
+            # the texts are only read a few chunks ahead of the results
+            read = []
+
+            def generate():
+                for i in range(1000):
+                    read.append(i)
+                    yield texts[i % len(texts)]
+            results = checker.check(generate())
+            next(results)
+            time.sleep(0.2)
+            self.assertLessEqual(len(read), 3 * 4)
+            results.close()
+
     def test_wording(self):
         """Verify that wording can be generated without failing"""
         self.positive(